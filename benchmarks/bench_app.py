@@ -0,0 +1,237 @@
+"""Headless load test for streamlit_app.py.
+
+Drives N concurrent simulated trainees through the app with Streamlit's
+AppTest, against the offline fakes in ``benchmarks/fakes.py``, and reports
+rerun latency percentiles, time-to-question, session memory and throughput
+for the login, assessment and mentor flows.
+
+    python benchmarks/bench_app.py --sessions 20 --model-latency 1.5
+
+Run it before and after a performance change and compare the tables. For
+runs that are identical every time, record a cassette once and replay it:
+
+    python benchmarks/bench_app.py --record /tmp/bench.jsonl
+    python benchmarks/bench_app.py --replay /tmp/bench.jsonl
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakes  # noqa: E402
+
+fakes.install()
+
+from unittest.mock import MagicMock  # noqa: E402
+
+import streamlit as st  # noqa: E402
+from streamlit import config  # noqa: E402
+from streamlit.runtime import Runtime  # noqa: E402
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager  # noqa: E402
+from streamlit.runtime.dataframe_source_manager import DataframeSourceManager  # noqa: E402
+from streamlit.runtime.media_file_manager import MediaFileManager  # noqa: E402
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage  # noqa: E402
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache  # noqa: E402
+from streamlit.runtime.secrets import Secrets  # noqa: E402
+from streamlit.testing.v1 import app_test, local_script_runner  # noqa: E402
+from streamlit.testing.v1.app_test import AppTest  # noqa: E402
+from streamlit.util import calc_hash  # noqa: E402
+
+APP = os.path.join(ROOT, "streamlit_app.py")
+MENTOR_QUESTIONS = [
+    "What altitude do I deploy at?",
+    "what altitude should I deploy at",
+    "When can I not board the aircraft because of weather?",
+    "How do I land in water?",
+]
+
+
+SECRETS = {
+    "SUPABASE_URL": "http://localhost",
+    "SUPABASE_KEY": "bench",
+    "gcp_service_account": {"type": "service_account"},
+}
+
+
+def share_runtime():
+    """Let many AppTests run at once, like sessions on one server.
+
+    Every AppTest.run() installs its own mock Runtime, secrets and config and
+    tears them down afterwards, which races when runs overlap. Point AppTest at
+    a throwaway Runtime subclass and install one shared runtime, secrets and
+    config for the whole benchmark instead. The compiled script is shared too,
+    as it is on a real server.
+    """
+    class _PerRunRuntime(Runtime):
+        pass
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = DataframeSourceManager()
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    runtime.bidi_component_registry = None
+    Runtime._instance = runtime
+    app_test.Runtime = _PerRunRuntime
+    script_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+
+    secrets = Secrets()
+    secrets._secrets = SECRETS
+    st.secrets = secrets
+    config.set_option("global.appTest", True)
+
+
+class Session:
+    """One simulated trainee, timing every rerun it triggers."""
+
+    def __init__(self, n, samples, timeout):
+        self.n = n
+        self.samples = samples
+        self.at = AppTest.from_file(APP, default_timeout=timeout)
+
+    def run(self, flow, metric="rerun"):
+        started = time.perf_counter()
+        self.at.run()
+        elapsed = time.perf_counter() - started
+        self.samples[(flow, metric)].append(elapsed)
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].value)
+        return elapsed
+
+    def button(self, prefix):
+        return next(b for b in self.at.button if b.label.startswith(prefix))
+
+    def login(self):
+        self.run("login", "first paint")
+        self.at.text_input[0].input(f"Bench Trainee {self.n}")
+        self.at.text_input[1].input(f"trainee{self.n}@bench.local")
+        self.button("Begin / Resume Training").click()
+        self.run("login", "login")
+
+    def assessment(self, max_answers=20):
+        for _ in range(max_answers):
+            if self.at.session_state["training_step"] > 3:
+                return True
+            if not self.at.radio:
+                self.button("Start Section").click()
+                self.run("assessment", "time-to-question")
+            self.at.radio[0].set_value(self.at.session_state["correct_answer"])
+            self.button("Submit Section").click()
+            self.run("assessment", "answer + next question")
+        return False
+
+    def mentor(self, questions):
+        self.at.session_state["training_step"] = 4
+        self.at._page_hash = calc_hash("live_mentor")  # Function pages have no file to switch to
+        self.run("mentor", "open")
+        for question in questions:
+            self.at.chat_input[0].set_value(question)
+            self.run("mentor", "answer")
+
+
+def session_bytes(at):
+    """Rough deep size of everything this session keeps in st.session_state."""
+    seen = set()
+
+    def size(obj):
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        total = sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            total += sum(size(k) + size(v) for k, v in obj.items())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            total += sum(size(item) for item in obj)
+        return total
+
+    return sum(size(at.session_state[key]) for key in at.session_state._state.filtered_state)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def simulate(n, flows, samples, timeout):
+    session = Session(n, samples, timeout)
+    completed = []
+    if "login" in flows or "assessment" in flows:
+        session.login()
+        completed.append("login")
+    if "assessment" in flows and session.assessment():
+        completed.append("assessment")
+    if "mentor" in flows:
+        session.mentor(MENTOR_QUESTIONS)
+        completed.append("mentor")
+    return completed, session_bytes(session.at)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent simulated trainees")
+    parser.add_argument("--model-latency", type=float, default=1.0, help="seconds per fake Gemini generation")
+    parser.add_argument("--db-latency", type=float, default=0.05, help="seconds per fake Supabase round trip")
+    parser.add_argument("--flows", default="login,assessment,mentor", help="comma separated flows to run")
+    parser.add_argument("--timeout", type=float, default=120, help="per-rerun AppTest timeout")
+    parser.add_argument("--bad-question-rate", type=float, default=0.0, help="share of malformed fake questions")
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument("--record", metavar="CASSETTE", help="append every fake generation to a cassette")
+    cassette.add_argument("--replay", metavar="CASSETTE", help="answer from a recorded cassette instead")
+    args = parser.parse_args()
+
+    fakes.MODEL_LATENCY = args.model_latency
+    fakes.DB_LATENCY = args.db_latency
+    fakes.BAD_QUESTION_RATE = args.bad_question_rate
+    flows = set(args.flows.split(","))
+    if args.record or args.replay:
+        SECRETS.update(MODEL_BACKEND="record" if args.record else "replay", MODEL_CASSETTE=args.record or args.replay)
+    samples = defaultdict(list)
+    share_runtime()
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    started = time.perf_counter()
+    completed, memory, failures = defaultdict(int), [], []
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        futures = [executor.submit(simulate, n, flows, samples, args.timeout) for n in range(args.sessions)]
+        for future in futures:
+            try:
+                done, session_memory = future.result()
+            except Exception as e:
+                failures.append(repr(e))
+                continue
+            memory.append(session_memory)
+            for flow in done:
+                completed[flow] += 1
+    wall = time.perf_counter() - started
+
+    reruns = sum(len(v) for v in samples.values())
+    print(f"sessions={args.sessions} model_latency={args.model_latency}s db_latency={args.db_latency}s")
+    print(f"{'flow':<12}{'step':<24}{'n':>6}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    for (flow, metric), values in sorted(samples.items()):
+        row = [percentile(values, p) for p in (50, 90, 99)] + [max(values)]
+        print(f"{flow:<12}{metric:<24}{len(values):>6}" + "".join(f"{v:>8.3f}s" for v in row))
+    print(f"\nwall time {wall:.1f}s, {reruns} reruns, {reruns / wall:.1f} reruns/s")
+    for flow in ("login", "assessment", "mentor"):
+        if flow in flows:
+            print(f"{flow}: {completed[flow]}/{args.sessions} completed, {completed[flow] / wall:.2f} flows/s")
+    if memory:
+        print(f"session state: mean {statistics.mean(memory) / 1024:.1f} KiB, max {max(memory) / 1024:.1f} KiB")
+    print(f"model calls {fakes.FakeVertexClient.model.calls}" + (" (replayed from cassette)" if args.replay else ""))
+    from skyhigh.metrics import metrics
+    for labels, value in metrics.values("question_generations_total"):
+        print(f"questions {labels['result']}{' (' + labels['reason'] + ')' if 'reason' in labels else ''}: {value:g}")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""Offline stand-ins for Vertex AI and Supabase used by the benchmark harness.
+
+``install()`` registers fake ``skyhigh.clients`` and ``supabase`` modules in
+``sys.modules`` before the app is first run, so ``streamlit_app.py`` runs
+unmodified against a latency-configurable Gemini model and an in-memory
+``skyhigh_users`` table. No network access or cloud SDKs are needed.
+"""
+import collections
+import itertools
+import json
+import random
+import re
+import sys
+import threading
+import time
+import types
+from types import SimpleNamespace
+
+# Tuned by the harness before any session starts
+MODEL_LATENCY = 1.0  # seconds per full generation
+DB_LATENCY = 0.05  # seconds per Supabase round trip
+JITTER = 0.2  # +/- fraction applied to every latency
+BAD_QUESTION_RATE = 0.0  # share of generated questions that are malformed
+
+MENTOR_ANSWER = (
+    "Per SOP-GEAR-02 the Mandatory Deployment Altitude is 3,000ft, and the Decision Window "
+    "begins at 5,000ft. Keep checking your altimeter every 5 seconds."
+)
+
+
+def _pause(seconds):
+    time.sleep(max(0.0, seconds * random.uniform(1 - JITTER, 1 + JITTER)))
+
+
+def _response(text, prompt=""):
+    usage = SimpleNamespace(prompt_token_count=len(prompt) // 4, candidates_token_count=len(text) // 4)
+    return SimpleNamespace(text=text, usage_metadata=usage)
+
+
+def _question(n, prompt):
+    # The procedure the focus names (it comes after the context), else the first one in the context
+    named = re.findall(r"\bSOP-[A-Z]+-\d+\b(?!:)", prompt)
+    cited = named[-1] if named else next(iter(re.findall(r"\bSOP-[A-Z]+-\d+\b", prompt)), None)
+    question = {
+        "stem": f"Benchmark question {n}?",
+        "options": {"A": "1,000ft", "B": "3,000ft", "C": "8,000ft", "D": "12,000ft"},
+        "answer": "ABCD"[n % 4],
+        "sop_id": cited or "SOP-GEAR-02",
+    }
+    if random.random() < BAD_QUESTION_RATE:
+        question = random.choice([
+            {**question, "answer": f"**{question['answer']}**."},  # Still usable once normalised
+            {**question, "options": {**question["options"], "D": "All of the above"}},
+            {**question, "sop_id": "SOP-NONE-00"},
+        ])
+    return json.dumps(question)
+
+
+class FakeGenerativeModel:
+    """Answers question prompts with a JSON question, anything else as the mentor."""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self.calls = 0
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        if "generation_config" in kwargs:
+            text = _question(next(self._ids), prompt)
+        else:
+            text = MENTOR_ANSWER
+        if not stream:
+            _pause(MODEL_LATENCY)
+            return _response(text, prompt)
+        return self._stream(text, prompt)
+
+    def _stream(self, text, prompt, chunks=10):
+        words = text.split(" ")
+        size = max(1, len(words) // chunks)
+        for i in range(0, len(words), size):
+            _pause(MODEL_LATENCY / chunks)
+            yield _response(" ".join(words[i:i + size]) + " ", prompt)
+
+
+class FakeVertexClient:
+    """Drop-in for ``skyhigh.clients.VertexClient``; one model per process."""
+
+    model = FakeGenerativeModel()
+
+    def __init__(self, service_account_info=None):
+        pass
+
+    def get(self):
+        return self.model
+
+    def reset(self):
+        pass
+
+    def generate_content(self, *args, **kwargs):
+        return self.model.generate_content(*args, **kwargs)
+
+
+class FakeTable:
+    """Just enough of the PostgREST query builder for ``skyhigh_users`` and the analytics tables.
+
+    The ``*_counts`` tables are worked out on every read, standing in for the
+    triggers that keep them up to date in Postgres.
+    """
+
+    rows = {}
+    events = []
+    lock = threading.Lock()
+
+    def __init__(self, name):
+        self.name = name
+        self._filters = []
+        self._op = None
+        self._payload = None
+        self._head = False
+        self._order = None
+        self._limit = None
+
+    def select(self, *columns, count=None, head=None, **kwargs):
+        self._op, self._head = "select", bool(head)
+        return self
+
+    def gt(self, column, value):
+        self._filters.append((column, lambda v: v is not None and v > value))
+        return self
+
+    def order(self, column, **kwargs):
+        self._order = column
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def eq(self, column, value):
+        self._filters.append((column, lambda v: v == value))
+        return self
+
+    def in_(self, column, values):
+        self._filters.append((column, lambda v: v in values))
+        return self
+
+    def upsert(self, payload, on_conflict=None, **kwargs):
+        self._op, self._payload = "upsert", payload
+        return self
+
+    def insert(self, payload, **kwargs):
+        self._op, self._payload = "insert", payload
+        return self
+
+    def execute(self):
+        _pause(DB_LATENCY)
+        with self.lock:
+            if self._op == "upsert":
+                payload = self._payload if isinstance(self._payload, list) else [self._payload]
+                for row in payload:
+                    self.rows.setdefault(row["email"], {}).update(row)
+                data = [dict(self.rows[row["email"]]) for row in payload]
+            elif self._op == "insert":
+                data = [dict(row) for row in self._payload]
+                self.events.extend(data)
+            else:
+                data = [dict(r) for r in self._source() if all(match(r.get(c)) for c, match in self._filters)]
+        count = len(data)
+        if self._order:
+            data.sort(key=lambda r: r[self._order])
+        data = [] if self._head else data[:self._limit]
+        return SimpleNamespace(data=data, count=count)
+
+
+    def _source(self):
+        if self.name == "skyhigh_events":
+            return self.events
+        if self.name == "skyhigh_stage_counts":
+            steps = collections.Counter(r.get("training_step") for r in self.rows.values())
+            return [{"training_step": step, "trainees": n} for step, n in steps.items() if step is not None]
+        if self.name == "skyhigh_answer_counts":
+            answers = collections.Counter(
+                (e["section"], e["question"], e["result"]) for e in self.events if e["result"] != "completed"
+            )
+            return [{"section": s, "question": q, "result": r, "answers": n} for (s, q, r), n in answers.items()]
+        if self.name == "skyhigh_completion_counts":
+            buckets = {}
+            for e in self.events:
+                if e["result"] == "completed":
+                    row = buckets.setdefault((e["section"], e["bucket"]), {
+                        "section": e["section"], "bucket": e["bucket"], "completions": 0, "seconds_sum": 0.0,
+                    })
+                    row["completions"] += 1
+                    row["seconds_sum"] += e["seconds"]
+            return list(buckets.values())
+        return self.rows.values()
+
+
+class FakeSupabase:
+    def table(self, name):
+        return FakeTable(name)
+
+
+def install():
+    clients = types.ModuleType("skyhigh.clients")
+    clients.VertexClient = FakeVertexClient
+    sys.modules["skyhigh.clients"] = clients
+
+    supabase = types.ModuleType("supabase")
+    supabase.Client = FakeSupabase
+    supabase.ClientOptions = lambda **kwargs: SimpleNamespace(**kwargs)
+    supabase.create_client = lambda url, key, *args, **kwargs: FakeSupabase()
+    sys.modules["supabase"] = supabase
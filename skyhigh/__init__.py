@@ -0,0 +1,6 @@
+"""Backend helpers for the SkyHigh AI Training app.
+
+Everything in here is imported once per server process, so objects that are
+shared between Streamlit sessions (clients, pools, caches) live here rather
+than in ``streamlit_app.py``, which is re-executed on every rerun.
+"""
@@ -0,0 +1,200 @@
+"""Cohort numbers for the admin dashboard, from aggregate tables kept up to date by Postgres.
+
+``supabase/analytics.sql`` creates the ``skyhigh_events`` log and the
+triggers that fold every new trainee, step change, answer and module
+completion into a handful of small ``*_counts`` tables as the rows are
+written. Reading the dashboard therefore costs a few tiny queries, however
+many trainees and events there are, and the numbers cover every replica
+and survive restarts.
+"""
+import bisect
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from skyhigh.metrics import Histogram, metrics
+
+log = logging.getLogger(__name__)
+
+# Time to pass a module; bucket i of an event is the first bound at or above its seconds
+COMPLETION_BUCKETS = (30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 86400)
+
+STAGE_COUNTS = "skyhigh_stage_counts"
+ANSWER_COUNTS = "skyhigh_answer_counts"
+COMPLETION_COUNTS = "skyhigh_completion_counts"
+
+Cohort = namedtuple("Cohort", "stages answers completions")  # See CohortStats.snapshot
+
+
+# Every event has the same keys, so a batch of them is one bulk insert
+def answer_event(email, section, question, correct):
+    return {
+        "email": email, "section": section, "question": question,
+        "result": "correct" if correct else "reset", "seconds": None, "bucket": None,
+    }
+
+
+def completion_event(email, section, seconds):
+    return {
+        "email": email, "section": section, "question": None,
+        "result": "completed", "seconds": seconds, "bucket": bisect.bisect_left(COMPLETION_BUCKETS, seconds),
+    }
+
+
+class CohortStats:
+    """The aggregate tables, cached for every admin session on this server.
+
+    A snapshot older than ``ttl`` seconds is still served while one
+    background refresh re-reads them, and a table whose read fails keeps
+    its last value, so the page never waits on the database. Roster pages
+    are cached for ``ttl`` too, the ``max_pages`` most recently read.
+    """
+
+    def __init__(self, client, table="skyhigh_users", ttl=60.0, page_size=50, max_pages=256):
+        self._client = client
+        self._table = table
+        self._ttl = ttl
+        self.page_size = page_size
+        self._lock = threading.Lock()
+        self._cohort = Cohort({}, {}, {})
+        self._refreshed_at = None
+        self._refreshing = None
+        self._max_pages = max_pages
+        self._pages = OrderedDict()  # (step, after) -> (rows, read_at)
+
+    def snapshot(self):
+        """Return ``(cohort, refreshed_at)``, starting a refresh if they are stale.
+
+        ``cohort.stages`` maps a training step to its trainees,
+        ``cohort.answers`` maps ``(section, question)`` to answers per result
+        and ``cohort.completions`` maps a section to a ``Histogram`` of
+        seconds taken to pass it. All are empty until the first refresh.
+        """
+        with self._lock:
+            stale = self._refreshed_at is None or time.time() - self._refreshed_at > self._ttl
+            cohort, refreshed_at = self._cohort, self._refreshed_at
+        if stale:
+            self.refresh()
+        return cohort, refreshed_at
+
+    def refresh(self):
+        with self._lock:
+            self._pages.clear()
+            if self._refreshing is not None and self._refreshing.is_alive():
+                return
+            self._refreshing = threading.Thread(target=self._reload, name="cohort-refresh", daemon=True)
+        self._refreshing.start()
+
+    def page(self, step, after=None):
+        """One page of trainees at ``step``, ordered by email, starting after the email ``after``.
+
+        Keyset pagination: each page is an indexed range scan, however deep it is.
+        A page read less than ``ttl`` seconds ago is served from the cache, and
+        an older one still is if reading it again fails.
+        """
+        key = (step, after)
+        with self._lock:
+            cached = self._pages.get(key)
+        if cached is not None and time.time() - cached[1] <= self._ttl:
+            return cached[0]
+        try:
+            query = self._client().table(self._table).select("full_name, email").eq("training_step", step)
+            if after is not None:
+                query = query.gt("email", after)
+            with metrics.span("db_call", op="roster"):
+                rows = query.order("email").limit(self.page_size).execute().data
+        except Exception:
+            if cached is None:
+                raise
+            metrics.inc("db_errors_total", op="roster")
+            log.warning("Reading the roster failed, serving the last page read", exc_info=True)
+            return cached[0]
+        with self._lock:
+            self._pages[key] = (rows, time.time())
+            self._pages.move_to_end(key)
+            while len(self._pages) > self._max_pages:
+                self._pages.popitem(last=False)
+        return rows
+
+    def _reload(self):
+        loaded = {}
+        for field, table, columns, parse in (
+            ("stages", STAGE_COUNTS, "training_step, trainees", _stages),
+            ("answers", ANSWER_COUNTS, "section, question, result, answers", _answers),
+            ("completions", COMPLETION_COUNTS, "section, bucket, completions, seconds_sum", _completions),
+        ):
+            try:
+                with metrics.span("db_call", op=table):
+                    loaded[field] = parse(self._client().table(table).select(columns).execute().data)
+            except Exception:
+                metrics.inc("db_errors_total", op=table)
+                log.warning("Reading %s failed", table, exc_info=True)
+        with self._lock:
+            self._cohort = self._cohort._replace(**loaded)
+            self._refreshed_at = time.time()
+
+
+def _stages(rows):
+    return {row["training_step"]: row["trainees"] for row in rows if row["trainees"]}
+
+
+def _answers(rows):
+    answers = {}
+    for row in rows:
+        answers.setdefault((row["section"], row["question"]), {})[row["result"]] = row["answers"]
+    return answers
+
+
+def _completions(rows):
+    completions = {}
+    for row in rows:
+        histogram = completions.setdefault(row["section"], Histogram(COMPLETION_BUCKETS))
+        histogram.counts[row["bucket"]] += row["completions"]
+        histogram.count += row["completions"]
+        histogram.sum += row["seconds_sum"]
+    return completions
+
+
+def funnel(counts, names):
+    """Rows of how many trainees reached each step, and what share of them got no further."""
+    rows, last = [], max(names)
+    for step, name in names.items():
+        reached = sum(n for s, n in counts.items() if s >= step)
+        stopped = counts.get(step, 0)
+        rows.append({
+            "stage": name,
+            "at this stage": stopped,
+            "reached": reached,
+            "drop-off": f"{stopped / reached:.0%}" if reached and step != last else "-",
+        })
+    return rows
+
+
+def answer_rows(answers, names):
+    """Rows of answers per module question, and the share that passed."""
+    rows = []
+    for (section, question), results in sorted(answers.items()):
+        correct, reset = results.get("correct", 0), results.get("reset", 0)
+        rows.append({
+            "module": names.get(section, section),
+            "question": question,
+            "correct": correct,
+            "reset": reset,
+            "pass rate": f"{correct / (correct + reset):.0%}" if correct + reset else "-",
+        })
+    return rows
+
+
+def completion_rows(completions, names):
+    """Rows of how long trainees took to pass each module, in minutes."""
+    return [
+        {
+            "module": names.get(section, section),
+            "passes": h.count,
+            "median min": round(h.quantile(0.5) / 60, 1),
+            "p95 min": round(h.quantile(0.95) / 60, 1),
+            "mean min": round(h.sum / h.count / 60, 1),
+        }
+        for section, h in sorted(completions.items()) if h.count
+    ]
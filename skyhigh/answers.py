@@ -0,0 +1,94 @@
+"""Shared cache of Live Jump Mentor answers."""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Words that never change what is being asked. Question words, negations and word order all
+# do ("when" vs "why", "can" vs "can't"), so they are kept.
+FILLER = frozenset("a an the please hey hi hello so just um uh ok okay".split())
+
+
+def normalise(question):
+    """Lowercase the question's words in order, dropping punctuation and extra whitespace."""
+    text = re.sub(r"(?<=\d),(?=\d)", "", question.lower())  # 3,000ft -> 3000ft
+    return " ".join(re.findall(r"[a-z0-9]+(?:'[a-z]+)?", text))
+
+
+def near_key(key):
+    """``key`` without its filler words; questions differing only in those share an answer."""
+    return " ".join(word for word in key.split() if word not in FILLER)
+
+
+class AnswerCache:
+    """Bounded LRU cache of mentor answers shared across sessions.
+
+    Entries expire after ``ttl`` seconds. A miss on the exact normalised
+    question falls back to a cached question that differs from it only in
+    ``FILLER`` words. Every entry belongs to one SOP version, and seeing a
+    different SOP hash empties the cache.
+    """
+
+    def __init__(self, max_entries=512, ttl=24 * 3600):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # normalised question -> (stored_at, answer)
+        self._near = {}  # near_key -> the normalised question last cached under it
+        self._sop_hash = None
+        self.hits = self.near_hits = self.misses = 0
+
+    def get(self, question, sop_hash):
+        key = normalise(question)
+        with self._lock:
+            self._check_version(sop_hash)
+            answer = self._lookup(key)
+            if answer is None:
+                near = self._near.get(near_key(key))
+                if near is not None:
+                    answer = self._lookup(near)
+                    if answer is not None:
+                        self.near_hits += 1
+            else:
+                self.hits += 1
+            if answer is None:
+                self.misses += 1
+            return answer
+
+    def put(self, question, sop_hash, answer):
+        key = normalise(question)
+        if not key:
+            return
+        with self._lock:
+            self._check_version(sop_hash)
+            self._entries[key] = (time.monotonic(), answer)
+            self._entries.move_to_end(key)
+            self._near[near_key(key)] = key
+            while len(self._entries) > self._max_entries:
+                self._forget(next(iter(self._entries)))
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "near_hits": self.near_hits, "misses": self.misses}
+
+    def _check_version(self, sop_hash):
+        if sop_hash != self._sop_hash:
+            self._entries.clear()
+            self._near.clear()
+            self._sop_hash = sop_hash
+
+    def _forget(self, key):
+        del self._entries[key]
+        if self._near.get(near_key(key)) == key:
+            del self._near[near_key(key)]
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, answer = entry
+        if time.monotonic() - stored_at > self._ttl:
+            self._forget(key)
+            return None
+        self._entries.move_to_end(key)
+        return answer
@@ -0,0 +1,129 @@
+"""Interchangeable model backends: live Vertex, record-to-cassette and replay-from-cassette.
+
+A backend is anything with ``generate_content(prompt, stream=False, **kwargs)``
+returning a response with ``.text`` (or, when streaming, an iterable of
+chunks with ``.text``). A cassette is a JSON Lines file with one recorded
+generation per line, keyed by the SHA-256 of the prompt.
+"""
+import hashlib
+import json
+import threading
+from collections import defaultdict
+from types import SimpleNamespace
+
+BACKENDS = ("vertex", "record", "replay")
+USAGE_FIELDS = ("prompt_token_count", "candidates_token_count")
+
+
+def prompt_key(prompt):
+    return hashlib.sha256(prompt.encode()).hexdigest()
+
+
+class CassetteMiss(LookupError):
+    """The cassette has no recording for this prompt."""
+
+
+def _chunk(text, usage=None):
+    return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(**usage) if usage else None)
+
+
+def _usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    return {field: getattr(usage, field, 0) or 0 for field in USAGE_FIELDS}
+
+
+def _text(chunk):
+    try:
+        return chunk.text
+    except ValueError:
+        return ""  # Chunks without text (e.g. the final usage chunk)
+
+
+class RecordingModel:
+    """Passes calls through to ``model`` and appends every generation to a cassette."""
+
+    def __init__(self, model, path):
+        self.model = model
+        self._path = path
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        response = self.model.generate_content(prompt, stream=stream, **kwargs)
+        if stream:
+            return self._recorded_stream(prompt, response)
+        self._write(prompt, [_text(response)], _usage(response))
+        return response
+
+    def _recorded_stream(self, prompt, response):
+        chunks, last = [], None
+        try:
+            for chunk in response:
+                chunks.append(_text(chunk))
+                last = chunk
+                yield chunk
+        finally:
+            close = getattr(response, "close", None)
+            if close:
+                close()
+        # Only complete streams are recorded; one cut short would replay a truncated answer
+        self._write(prompt, chunks, _usage(last))
+
+    def _write(self, prompt, chunks, usage):
+        line = json.dumps({"key": prompt_key(prompt), "prompt": prompt, "chunks": chunks, "usage": usage})
+        with self._lock, open(self._path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class ReplayModel:
+    """Answers instantly from a cassette, with no network or credentials.
+
+    A prompt recorded several times (a question prompt, say) replays its
+    recordings in order and then starts again, so repeated calls still get
+    varied answers and a run replays the same way every time.
+    """
+
+    def __init__(self, path):
+        self._recordings = defaultdict(list)  # prompt key -> recorded generations
+        self._next = defaultdict(int)
+        self._lock = threading.Lock()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._recordings[entry["key"]].append(entry)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._recordings.values())
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        key = prompt_key(prompt)
+        entries = self._recordings.get(key)
+        if not entries:
+            raise CassetteMiss(f"No recording for prompt {key[:12]}")
+        with self._lock:
+            entry = entries[self._next[key] % len(entries)]
+            self._next[key] += 1
+        if stream:
+            return self._replay_stream(entry)
+        return _chunk("".join(entry["chunks"]), entry["usage"])
+
+    def _replay_stream(self, entry):
+        chunks = entry["chunks"]
+        for i, text in enumerate(chunks):
+            yield _chunk(text, entry["usage"] if i == len(chunks) - 1 else None)
+
+
+def open_backend(kind, cassette=None, live=None):
+    """Build the ``kind`` backend. ``live`` is called to make the Vertex client when one is needed."""
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown model backend {kind!r}, expected one of {', '.join(BACKENDS)}")
+    if kind == "replay":
+        return ReplayModel(cassette)
+    if kind == "record":
+        return RecordingModel(live(), cassette)
+    return live()
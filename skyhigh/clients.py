@@ -0,0 +1,58 @@
+"""The process-wide Vertex AI client."""
+import threading
+
+import vertexai
+from google.api_core import exceptions as api_exceptions
+from google.auth.exceptions import GoogleAuthError
+from google.auth.transport.requests import Request
+from google.oauth2 import service_account
+from vertexai.generative_models import GenerativeModel
+
+PROJECT = "ai-training-demo-1-482218"
+LOCATION = "europe-west1"
+MODEL_NAME = "gemini-2.0-flash-001"
+SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+# Errors that mean the connection itself is bad, so the model gets rebuilt
+REBUILD_ERRORS = (GoogleAuthError, api_exceptions.Unauthenticated, api_exceptions.ServiceUnavailable)
+
+
+class VertexClient:
+    """Gemini model handle shared by every session on this server.
+
+    The credentials and model are built once. The access token is refreshed
+    under a lock only when it has expired, so concurrent sessions never race
+    each other to re-authenticate, and a connection-level failure drops the
+    model so the next call rebuilds it from scratch.
+    """
+
+    def __init__(self, service_account_info):
+        self._info = dict(service_account_info)
+        self._lock = threading.Lock()
+        self._credentials = None
+        self._model = None
+        self._build()
+
+    def _build(self):
+        self._credentials = service_account.Credentials.from_service_account_info(self._info, scopes=SCOPES)
+        vertexai.init(project=PROJECT, location=LOCATION, credentials=self._credentials)
+        self._model = GenerativeModel(MODEL_NAME)
+
+    def reset(self):
+        with self._lock:
+            self._model = None
+
+    def get(self):
+        with self._lock:
+            if self._model is None:
+                self._build()
+            if not self._credentials.valid:
+                self._credentials.refresh(Request())
+            return self._model
+
+    def generate_content(self, *args, **kwargs):
+        try:
+            return self.get().generate_content(*args, **kwargs)
+        except REBUILD_ERRORS:
+            self.reset()
+            raise
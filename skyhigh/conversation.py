@@ -0,0 +1,121 @@
+"""Token-budgeted multi-turn memory for the Live Jump Mentor."""
+import re
+from collections import namedtuple
+
+from skyhigh.retrieval import format_context
+
+Turn = namedtuple("Turn", "question answer sop_ids")  # answer is None if the mentor was unavailable
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s")
+
+# The labels around a follow-up's parts, so their tokens are budgeted too
+_FRAME = "SOP Context: \nEarlier in this conversation:\n\nRecent conversation:\n\nUser Question: "
+
+
+def estimate_tokens(text):
+    """Roughly four characters per token, close enough for budgeting English prompts."""
+    return len(text) // 4 + 1
+
+
+def first_sentence(text, limit=200):
+    return _SENTENCE.split(text.strip(), maxsplit=1)[0][:limit]
+
+
+def _exchange(turn):
+    return f"Trainee: {turn.question}\nMentor: {turn.answer}"
+
+
+class Conversation:
+    """One trainee's mentor chat, kept in their session.
+
+    Every prompt fits in ``budget`` tokens. The procedures retrieved for the
+    new question go in first, then as many recent turns as fit, newest
+    first. Turns that no longer fit are folded for good into a rolling
+    summary of one line per turn, capped at ``summary_budget`` tokens. Each
+    SOP procedure appears in a prompt at most once, however many turns
+    referred to it.
+    """
+
+    def __init__(self, budget=2000, summary_budget=300, max_turns=50):
+        self.budget = budget
+        self.summary_budget = summary_budget
+        self.max_turns = max_turns
+        self.turns = []  # Shown on screen; turns[compacted:] are still sent verbatim
+        self.compacted = 0
+        self.summary = []
+
+    def __bool__(self):
+        return bool(self.turns)
+
+    def standalone(self):
+        """True if the next prompt carries no earlier turns, so its answer depends on the question alone."""
+        return not self._live_turns() and not self.summary
+
+    def prompt(self, question, index, k=3):
+        """Return ``(prompt, sop_ids)`` for ``question`` against a ``SopIndex``."""
+        chunks = index.search(question, k=k)
+        sop_ids = [chunk.sop_id for chunk in chunks]
+        context = format_context(chunks)
+        if self.standalone():
+            return f"SOP Context: {context}\nUser Question: {question}", sop_ids  # Same as a one-off question
+
+        # The summary's share is set aside up front, as it may grow by the turns compacted below
+        left = (self.budget - estimate_tokens(_FRAME) - estimate_tokens(context) - estimate_tokens(question)
+                - self.summary_budget)
+        kept = []
+        for turn in reversed(self._live_turns()):
+            cost = estimate_tokens(_exchange(turn))
+            if cost > left:
+                break
+            kept.insert(0, turn)
+            left -= cost
+        self._compact(len(self._live_turns()) - len(kept))
+
+        # Earlier turns' procedures, if there is room and they are not already in
+        extra = []
+        for turn in reversed(kept):
+            for sop_id in turn.sop_ids:
+                chunk = index.by_id.get(sop_id)
+                if chunk is None or chunk in chunks or chunk in extra:
+                    continue
+                # Measured on the rendered context, as the chunk may bring its section heading
+                wider = format_context(chunks + extra + [chunk])
+                cost = estimate_tokens(wider) - estimate_tokens(context)
+                if cost <= left:
+                    extra.append(chunk)
+                    context = wider
+                    left -= cost
+
+        parts = [f"SOP Context: {context}"]
+        if self.summary:
+            parts.append("Earlier in this conversation:\n" + "\n".join(self.summary))
+        if kept:
+            parts.append("Recent conversation:\n" + "\n".join(_exchange(turn) for turn in kept))
+        parts.append(f"User Question: {question}")
+        return "\n".join(parts), sop_ids
+
+    def add(self, question, answer, sop_ids=()):
+        self.turns.append(Turn(question, answer, tuple(sop_ids)))
+        if len(self.turns) > self.max_turns:
+            dropped = len(self.turns) - self.max_turns
+            self._compact(max(dropped - self.compacted, 0))
+            del self.turns[:dropped]
+            self.compacted = max(self.compacted - dropped, 0)
+
+    def _live_turns(self):
+        return [turn for turn in self.turns[self.compacted:] if turn.answer is not None]
+
+    def _compact(self, n):
+        """Fold the oldest ``n`` answered live turns into the summary."""
+        while n > 0 and self.compacted < len(self.turns):
+            turn = self.turns[self.compacted]
+            self.compacted += 1
+            if turn.answer is None:
+                continue
+            self.summary.append(f"- Asked: {turn.question} Answered: {first_sentence(turn.answer)}")
+            n -= 1
+        while len(self.summary) > 1 and self._summary_tokens() > self.summary_budget:
+            self.summary.pop(0)
+
+    def _summary_tokens(self):
+        return sum(estimate_tokens(line) for line in self.summary)
@@ -0,0 +1,104 @@
+"""Discovery and lazy loading of SOP manuals, many per deployment."""
+import hashlib
+import mmap
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from skyhigh.metrics import metrics
+from skyhigh.retrieval import SopIndex
+
+Manual = namedtuple("Manual", "name sop_hash index")
+
+
+class Corpus:
+    """Every ``*<suffix>`` file in ``root`` is a manual named after its stem.
+
+    Nothing is read until a manual is first asked for. Files of at least
+    ``mmap_threshold`` bytes are memory-mapped, so hashing one never copies
+    it into Python memory, and the text is only decoded when that content
+    has not been parsed before. Parsed indexes are cached by content hash in
+    an LRU of ``max_loaded``, so memory follows the manuals in use rather
+    than the number on disk. Each ``get`` re-stats its file, and only a file
+    whose size or mtime changed is read again.
+    """
+
+    def __init__(self, root, suffix="_sop.txt", max_loaded=32, mmap_threshold=1 << 20, rescan_interval=10.0):
+        self._root = root
+        self._suffix = suffix
+        self._max_loaded = max_loaded
+        self._mmap_threshold = mmap_threshold
+        self._rescan_interval = rescan_interval
+        self._lock = threading.Lock()
+        self._names = None
+        self._scanned_at = 0.0
+        self._files = {}  # name -> ((size, mtime_ns), content hash)
+        self._parsed = OrderedDict()  # content hash -> SopIndex
+        self._loading = {}  # name -> lock, so one manual is never parsed twice at once
+
+    def names(self):
+        with self._lock:
+            if self._names is None or time.monotonic() - self._scanned_at > self._rescan_interval:
+                self._names = sorted(
+                    entry.name[:-len(self._suffix)]
+                    for entry in os.scandir(self._root)
+                    if entry.is_file() and entry.name.endswith(self._suffix)
+                )
+                self._scanned_at = time.monotonic()
+            return list(self._names)
+
+    def path(self, name):
+        return os.path.join(self._root, name + self._suffix)
+
+    def get(self, name):
+        """Return the ``Manual`` called ``name``; raises FileNotFoundError if there is none."""
+        if os.sep in name or (os.altsep and os.altsep in name):
+            raise FileNotFoundError(f"No manual called {name!r}")
+        stat = os.stat(self.path(name))
+        signature = (stat.st_size, stat.st_mtime_ns)
+        hit = self._cached(name, signature)
+        if hit is not None:
+            return hit
+        with self._lock:
+            loading = self._loading.setdefault(name, threading.Lock())
+        with loading:
+            hit = self._cached(name, signature)  # Another session may have just loaded it
+            if hit is not None:
+                return hit
+            with metrics.span("manual_load"):
+                sop_hash, index = self._load(name, stat.st_size)
+            with self._lock:
+                self._files[name] = (signature, sop_hash)
+                self._remember(sop_hash, index)
+            return Manual(name, sop_hash, index)
+
+    def _cached(self, name, signature):
+        with self._lock:
+            known = self._files.get(name)
+            if known is None or known[0] != signature or known[1] not in self._parsed:
+                return None
+            self._parsed.move_to_end(known[1])
+            return Manual(name, known[1], self._parsed[known[1]])
+
+    def _load(self, name, size):
+        with open(self.path(name), "rb") as f:
+            if size < self._mmap_threshold:
+                data = f.read()
+                return self._parse(hashlib.sha256(data).hexdigest(), data)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return self._parse(hashlib.sha256(data).hexdigest(), data)
+
+    def _parse(self, sop_hash, data):
+        with self._lock:
+            index = self._parsed.get(sop_hash)
+        if index is None:  # Unchanged content (a touched or copied file) keeps its parsed index
+            metrics.inc("manual_parses_total")
+            index = SopIndex.from_text(str(data, "utf-8"))
+        return sop_hash, index
+
+    def _remember(self, sop_hash, index):
+        self._parsed[sop_hash] = index
+        self._parsed.move_to_end(sop_hash)
+        while len(self._parsed) > self._max_loaded:
+            self._parsed.popitem(last=False)
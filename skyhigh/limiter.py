@@ -0,0 +1,269 @@
+"""Process-wide admission control for Gemini calls."""
+import hashlib
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from skyhigh.metrics import metrics
+
+RETRYABLE_CODES = (429, 503)
+RETRYABLE_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable"}
+THROTTLED_NAMES = {"ResourceExhausted", "TooManyRequests"}
+
+
+def is_retryable(error):
+    return getattr(error, "code", None) in RETRYABLE_CODES or type(error).__name__ in RETRYABLE_NAMES
+
+
+def is_throttled(error):
+    """A quota pushback (429): Vertex is up, we are just calling it too fast."""
+    return getattr(error, "code", None) == 429 or type(error).__name__ in THROTTLED_NAMES
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._burst, self._tokens + (now - self._stamp) * self._rate)
+            self._stamp = now
+            self._tokens -= 1
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class _SharedStream:
+    """One upstream stream fanned out to every session asking the same thing."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._chunks = []
+        self._done = False
+        self._abandoned = False
+        self._error = None
+        self._readers = 0
+
+    def attach(self):
+        """Return a reader over the whole stream, or None if it was abandoned half way."""
+        with self._cond:
+            if self._abandoned:
+                return None
+            self._readers += 1
+        return self._read()
+
+    def feed(self, source):
+        try:
+            for chunk in source:
+                with self._cond:
+                    if self._readers == 0:
+                        self._abandoned = True  # Everyone has gone, so stop paying for tokens
+                        break
+                    self._chunks.append(chunk)
+                    self._cond.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            close = getattr(source, "close", None)
+            if close:
+                close()
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def _read(self):
+        i = 0
+        try:
+            while True:
+                with self._cond:
+                    while i >= len(self._chunks) and not self._done:
+                        self._cond.wait()
+                    if i < len(self._chunks):
+                        chunk = self._chunks[i]
+                    elif self._error is not None:
+                        raise self._error
+                    else:
+                        return
+                i += 1
+                yield chunk
+        finally:
+            with self._cond:
+                self._readers -= 1
+
+
+class ModelLimiter:
+    """Wraps a model so that bursts queue instead of tripping Vertex quotas.
+
+    At most ``max_concurrent`` calls run at once and calls start at no more
+    than ``rate`` per second (bursting to ``burst``). Waiting calls are
+    granted round-robin across sessions, so one busy session (or the
+    background question refills) cannot starve the rest. 429/503 responses are
+    retried with jittered exponential backoff. Calls made with
+    ``coalesce=True`` share the result of an identical call already in flight.
+
+    A plain call may pass a ``deadline`` (a ``time.monotonic()`` value). It
+    then raises TimeoutError rather than queue or retry past it, and the
+    deadline is passed on for the wrapped model to bound the call itself.
+    A stream that has not been granted a slot within ``first_token_timeout``
+    seconds of being asked for raises TimeoutError the same way.
+
+    A slot is held until the wrapped model calls the ``on_finish`` it is
+    given, so a call whose caller timed out still counts against
+    ``max_concurrent`` while its request is running upstream.
+    """
+
+    def __init__(self, model, session_id=lambda: None, max_concurrent=16, rate=10.0, burst=20,
+                 max_retries=4, backoff=0.5, first_token_timeout=None):
+        self.model = model
+        self._session_id = session_id
+        self._max_concurrent = max_concurrent
+        self._bucket = TokenBucket(rate, burst)
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._first_token_timeout = first_token_timeout
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()  # session -> waiting tickets, in grant order
+        self._active = 0
+        self._inflight_lock = threading.Lock()
+        self._inflight = {}  # prompt key -> Future or _SharedStream
+        self._streams = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="model-stream")
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def generate_content(self, prompt, stream=False, coalesce=False, deadline=None, **kwargs):
+        session = self._session_id() or "background"
+        if stream and deadline is None and self._first_token_timeout is not None:
+            deadline = time.monotonic() + self._first_token_timeout
+        if not coalesce:
+            if stream:
+                return self._stream(prompt, session, kwargs, deadline)
+            return self._call(prompt, session, kwargs, deadline)
+        key = hashlib.sha256(f"{stream}|{prompt}|{sorted(kwargs.items())}".encode()).hexdigest()
+        if stream:
+            return self._shared_stream(key, prompt, session, kwargs, deadline)
+        with self._inflight_lock:
+            shared = self._inflight.get(key)
+            leader = shared is None
+            if leader:
+                shared = self._inflight[key] = Future()
+        if not leader:
+            metrics.inc("model_coalesced_total", stream="false")
+            return shared.result()
+        try:
+            shared.set_result(self._call(prompt, session, kwargs, deadline))
+        except Exception as e:
+            shared.set_exception(e)
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+        return shared.result()
+
+    def _shared_stream(self, key, prompt, session, kwargs, deadline):
+        with self._inflight_lock:
+            shared = self._inflight.get(key)
+            reader = shared.attach() if shared is not None else None
+            if reader is not None:
+                metrics.inc("model_coalesced_total", stream="true")
+                return reader
+            shared = self._inflight[key] = _SharedStream()
+            reader = shared.attach()
+        # Fed from a worker thread, so the stream carries on if the first session goes away
+        self._streams.submit(self._feed, key, shared, prompt, session, kwargs, deadline)
+        return reader
+
+    def _feed(self, key, shared, prompt, session, kwargs, deadline):
+        try:
+            shared.feed(self._stream(prompt, session, kwargs, deadline))
+        finally:
+            with self._inflight_lock:
+                if self._inflight.get(key) is shared:
+                    del self._inflight[key]
+
+    def _call(self, prompt, session, kwargs, deadline=None):
+        if deadline is not None:
+            kwargs = {**kwargs, "deadline": deadline}
+        for attempt in range(self._max_retries + 1):
+            self._acquire(session, deadline)
+            try:
+                return self.model.generate_content(prompt, on_finish=self._release, **kwargs)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self._max_retries or _remaining(deadline) <= 0:
+                    raise
+                metrics.inc("model_retries_total", error=type(e).__name__)
+            time.sleep(max(min(random.uniform(0, self._backoff * 2 ** attempt), _remaining(deadline)), 0))
+
+    def _stream(self, prompt, session, kwargs, deadline=None):
+        # The deadline only bounds the wait for a slot; once granted, the wrapped model times the stream
+        for attempt in range(self._max_retries + 1):
+            self._acquire(session, deadline)
+            started = False
+            try:
+                response = self.model.generate_content(prompt, stream=True, on_finish=self._release, **kwargs)
+                try:
+                    for chunk in response:
+                        started = True
+                        yield chunk
+                finally:
+                    close = getattr(response, "close", None)
+                    if close:
+                        close()
+                return
+            except Exception as e:
+                # Once text has gone out a retry would repeat it, so only retry before that
+                if started or not is_retryable(e) or attempt == self._max_retries or _remaining(deadline) <= 0:
+                    raise
+                metrics.inc("model_retries_total", error=type(e).__name__)
+            time.sleep(max(min(random.uniform(0, self._backoff * 2 ** attempt), _remaining(deadline)), 0))
+
+    def _acquire(self, session, deadline=None):
+        queued = time.perf_counter()
+        ticket = object()
+        with self._cond:
+            self._queues.setdefault(session, deque()).append(ticket)
+            while self._active >= self._max_concurrent or self._head() is not ticket:
+                remaining = _remaining(deadline)
+                if remaining <= 0:
+                    self._leave(session, ticket)
+                    metrics.inc("model_queue_timeouts_total")
+                    raise TimeoutError("No model slot came free before the deadline")
+                self._cond.wait(None if deadline is None else remaining)
+            waiting = self._queues[session]
+            waiting.popleft()
+            if waiting:
+                self._queues.move_to_end(session)  # Round-robin: other sessions go next
+            else:
+                del self._queues[session]
+            self._active += 1
+            self._cond.notify_all()
+        self._bucket.acquire()
+        metrics.observe("model_queue_seconds", time.perf_counter() - queued)
+
+    def _leave(self, session, ticket):
+        waiting = self._queues[session]
+        waiting.remove(ticket)
+        if not waiting:
+            del self._queues[session]
+        self._cond.notify_all()  # The next ticket may now be at the head
+
+    def _release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def _head(self):
+        for waiting in self._queues.values():
+            return waiting[0]
+        return None
+
+
+def _remaining(deadline):
+    return float("inf") if deadline is None else deadline - time.monotonic()
@@ -0,0 +1,210 @@
+"""In-process timing histograms and counters, exposed in Prometheus text format."""
+import bisect
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+_NOOP = nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside the bucket it falls in."""
+        if not self.count:
+            return 0.0
+        rank, seen, lower = q * self.count, 0, 0.0
+        for upper, n in zip(self.buckets, self.counts):
+            if n and seen + n >= rank:
+                return lower + (upper - lower) * (rank - seen) / n
+            seen, lower = seen + n, upper
+        return self.buckets[-1]
+
+
+class Metrics:
+    """Registry of labelled histograms and counters shared by the whole process.
+
+    When ``enabled`` is False, ``span`` hands back a shared no-op context
+    manager and ``observe``/``inc`` return immediately.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = {}  # (name, labels) -> float
+        self._buckets = {}  # name -> buckets, for histograms that don't fit the default ones
+
+    def define(self, name, buckets):
+        """Use ``buckets`` instead of ``BUCKETS`` for the histogram ``name``."""
+        self._buckets[name] = tuple(buckets)
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self._buckets.get(name, BUCKETS))
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def span(self, name, **labels):
+        """Time a block into the ``<name>_seconds`` histogram."""
+        if not self.enabled:
+            return _NOOP
+        return self._span(name, labels)
+
+    @contextmanager
+    def _span(self, name, labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - started, **labels)
+
+    def summary(self):
+        """One row per histogram, for the admin panel."""
+        with self._lock:
+            items = sorted(self._histograms.items())
+            return [
+                {
+                    "metric": name,
+                    **dict(labels),
+                    "count": h.count,
+                    "mean_s": round(h.sum / h.count, 4),
+                    "p50_s": round(h.quantile(0.5), 4),
+                    "p95_s": round(h.quantile(0.95), 4),
+                }
+                for (name, labels), h in items
+            ]
+
+    def values(self, name):
+        """``(labels, value)`` for every counter called ``name``."""
+        with self._lock:
+            return [(dict(labels), value) for (n, labels), value in sorted(self._counters.items()) if n == name]
+
+    def counters(self):
+        with self._lock:
+            return {f"{name}{_labels(labels)}": value for (name, labels), value in sorted(self._counters.items())}
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines, typed = [], set()
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{_labels(labels)} {value}")
+            for (name, labels), h in sorted(self._histograms.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for upper, n in zip(h.buckets, h.counts):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', upper),))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {h.count}")
+                lines.append(f"{name}_sum{_labels(labels)} {h.sum}")
+                lines.append(f"{name}_count{_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="0.0.0.0"):
+        """Serve ``render()`` at ``/metrics`` from a daemon thread."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class InstrumentedModel:
+    """Wraps anything with ``generate_content`` to time calls and count tokens."""
+
+    def __init__(self, model, registry):
+        self.model = model
+        self._metrics = registry
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def generate_content(self, *args, stream=False, **kwargs):
+        if not self._metrics.enabled:
+            return self.model.generate_content(*args, stream=stream, **kwargs)
+        started = time.perf_counter()
+        try:
+            response = self.model.generate_content(*args, stream=stream, **kwargs)
+        except Exception as e:
+            self._metrics.inc("model_errors_total", error=type(e).__name__)
+            raise
+        if stream:
+            return self._timed_stream(response, started)
+        self._metrics.observe("model_call_seconds", time.perf_counter() - started, stream="false")
+        self._count_tokens(response)
+        return response
+
+    def _timed_stream(self, response, started):
+        last = None
+        try:
+            for chunk in response:
+                if last is None:
+                    self._metrics.observe("model_first_token_seconds", time.perf_counter() - started)
+                last = chunk
+                yield chunk
+        finally:
+            self._metrics.observe("model_call_seconds", time.perf_counter() - started, stream="true")
+            if last is not None:
+                self._count_tokens(last)  # Usage arrives with the final chunk
+            close = getattr(response, "close", None)
+            if close:
+                close()
+
+    def _count_tokens(self, response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self._metrics.inc("model_prompt_tokens_total", getattr(usage, "prompt_token_count", 0) or 0)
+            self._metrics.inc("model_response_tokens_total", getattr(usage, "candidates_token_count", 0) or 0)
+
+
+metrics = Metrics()
@@ -0,0 +1,204 @@
+"""Trainee progress persistence for the ``skyhigh_users`` table."""
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+
+from skyhigh.metrics import metrics
+from skyhigh.resilience import CircuitBreaker, CircuitOpenError
+
+log = logging.getLogger(__name__)
+
+
+class ProgressStore:
+    """Read-through cache plus write-behind queue in front of Supabase.
+
+    ``resume`` costs at most one round trip (a single upsert that returns the
+    stored row) and nothing at all for an email this process has already
+    seen. ``save`` only updates memory; a background thread coalesces the
+    pending rows per email and upserts them in batches every
+    ``flush_interval`` seconds, and once more when the process exits.
+    Analytics events passed to ``record`` are inserted into ``events_table``
+    by the same thread; at most ``max_events`` wait at once.
+
+    Every call goes through a circuit breaker. While it is open, ``resume``
+    answers from memory and writes stay queued until a probe succeeds.
+    """
+
+    def __init__(self, connect, table="skyhigh_users", flush_interval=2.0, max_cached=50_000, breaker=None,
+                 events_table="skyhigh_events", max_events=10_000):
+        self._connect = connect
+        self._breaker = breaker or CircuitBreaker("database")
+        self._table = table
+        self._events_table = events_table
+        self._max_events = max_events
+        self._flush_interval = flush_interval
+        self._max_cached = max_cached
+        self._client = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._steps = OrderedDict()  # email -> training_step
+        self._pending = {}  # email -> row waiting to be written
+        self._events = []  # analytics events waiting to be inserted, oldest first
+        self._unverified = set()  # emails resumed while the database was unreachable
+        self._closed = threading.Event()
+        self._writer = threading.Thread(target=self._run, name="progress-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def client(self):
+        if self._client is None:
+            self._client = self._connect()
+        return self._client
+
+    def resume(self, full_name, email):
+        """Return the stored training step for ``email``, creating the user if needed.
+
+        If the database cannot be reached the trainee starts at step 1 and is
+        marked unverified (see ``verified``); whatever they save is merged with
+        the stored row once the database is back, so progress is never lowered.
+        """
+        with self._lock:
+            step = None if email in self._unverified else self._steps.get(email)
+        if step is not None:
+            # Nothing is written: another replica may have moved the row on since it was cached
+            return step
+        # Only name and email are sent, so an existing row keeps its training_step
+        row = {"full_name": full_name, "email": email}
+        try:
+            self._breaker.before_call()
+            with metrics.span("db_call", op="resume"):
+                response = self.client().table(self._table).upsert(row, on_conflict="email").execute()
+        except Exception as e:
+            if not isinstance(e, CircuitOpenError):
+                self._failed("resume")
+            log.warning("Resuming %s without the database: %s", email, e)
+            with self._lock:
+                self._unverified.add(email)
+                return self._steps.get(email, 1)
+        self._breaker.success()
+        stored = response.data[0].get("training_step") if response.data else None
+        if stored is not None and stored < 1:
+            stored = None  # A new row got the column's default (say 0), not a real step
+        with self._lock:
+            self._unverified.discard(email)
+            if stored is not None:
+                self._remember(email, stored)
+        if stored is not None:
+            return stored
+        step = 1  # Saved below, so a new row always holds a real step
+        self.save(full_name, email, step)
+        return step
+
+    def verified(self, email):
+        """False while ``email``'s step is a guess made without the database."""
+        with self._lock:
+            return email not in self._unverified
+
+    def save(self, full_name, email, training_step):
+        with self._lock:
+            self._remember(email, training_step)
+            self._pending[email] = {"full_name": full_name, "email": email, "training_step": training_step}
+
+    def record(self, event):
+        """Queue an analytics event (see ``skyhigh.analytics``) for the background writer."""
+        with self._lock:
+            self._events.append(event)
+            if len(self._events) > self._max_events:
+                del self._events[0]
+                metrics.inc("db_events_dropped_total")
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = list(self._pending.values()), {}
+                events, self._events = self._events, []
+            if not rows and not events:
+                return
+            try:
+                self._breaker.before_call()
+            except CircuitOpenError:
+                self._requeue(rows)  # Stay queued until the breaker lets a probe through
+                self._requeue_events(events)
+                return
+            if not rows:
+                self._breaker.abandon()  # Events alone are no probe, see _insert_events
+                self._insert_events(events)
+                return
+            try:
+                with metrics.span("db_call", op="flush"):
+                    client = self.client()
+                    self._reconcile(client, rows)
+                    client.table(self._table).upsert(rows, on_conflict="email").execute()
+            except Exception:
+                self._failed("flush")
+                log.exception("Progress flush failed, will retry %d rows", len(rows))
+                self._requeue(rows)
+                return
+            self._breaker.success()
+            metrics.inc("db_rows_written_total", len(rows))
+            self._insert_events(events)
+
+    def _insert_events(self, events):
+        # Kept apart from progress: failing here (say, before analytics.sql has been run) must
+        # neither trip the breaker nor hold back anyone's training step
+        if not events:
+            return
+        try:
+            with metrics.span("db_call", op="events"):
+                self.client().table(self._events_table).insert(events).execute()
+        except Exception as e:
+            metrics.inc("db_errors_total", op="events")
+            log.warning("Inserting %d analytics events failed, will retry: %s", len(events), e)
+            self._requeue_events(events)
+
+    def _reconcile(self, client, rows):
+        # Rows saved while the database was down may be behind what it already holds
+        with self._lock:
+            emails = [row["email"] for row in rows if row["email"] in self._unverified]
+        if not emails:
+            return
+        response = client.table(self._table).select("email, training_step").in_("email", emails).execute()
+        stored = {r["email"]: r.get("training_step") or 1 for r in response.data}
+        for row in rows:
+            row["training_step"] = max(row["training_step"], stored.get(row["email"], 1))
+        with self._lock:
+            self._unverified.difference_update(emails)
+            for row in rows:
+                if row["email"] in emails:
+                    self._remember(row["email"], row["training_step"])
+
+    def _failed(self, op):
+        self._breaker.failure()
+        metrics.inc("db_errors_total", op=op)
+        self._client = None  # Rebuild the connection on the next call
+
+    def _requeue(self, rows):
+        with self._lock:
+            for row in rows:
+                self._pending.setdefault(row["email"], row)  # Keep anything newer
+
+    def _requeue_events(self, events):
+        with self._lock:
+            self._events[:0] = events
+            dropped = len(self._events) - self._max_events
+            if dropped > 0:
+                del self._events[:dropped]
+                metrics.inc("db_events_dropped_total", dropped)
+
+    def close(self):
+        self._closed.set()
+        self._writer.join(timeout=self._flush_interval * 2)
+        self.flush()
+        if self._pending:
+            log.warning("Exiting with %d progress rows not written", len(self._pending))
+
+    def _remember(self, email, training_step):
+        self._steps[email] = training_step
+        self._steps.move_to_end(email)
+        while len(self._steps) > self._max_cached:
+            self._steps.popitem(last=False)
+
+    def _run(self):
+        while not self._closed.wait(self._flush_interval):
+            self.flush()
@@ -0,0 +1,243 @@
+"""Pre-generated assessment questions shared by every session."""
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from skyhigh.backends import CassetteMiss
+from skyhigh.metrics import metrics
+from skyhigh.resilience import CircuitOpenError
+
+log = logging.getLogger(__name__)
+
+LETTERS = ("A", "B", "C", "D")
+# Options that make more than one answer right, or none
+CATCH_ALLS = re.compile(r"\b(all|none|both|neither) of (the )?(above|these|them)\b|^(all|both|none)$", re.I)
+
+# Asks Vertex for JSON in exactly this shape
+QUESTION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "stem": {"type": "STRING"},
+        "options": {
+            "type": "OBJECT",
+            "properties": {letter: {"type": "STRING"} for letter in LETTERS},
+            "required": list(LETTERS),
+        },
+        "answer": {"type": "STRING", "enum": list(LETTERS)},
+        "sop_id": {"type": "STRING"},
+    },
+    "required": ["stem", "options", "answer", "sop_id"],
+}
+GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": QUESTION_SCHEMA}
+
+
+class Question(namedtuple("Question", "stem options answer sop_id")):
+    """A multiple choice question: ``options`` holds the A-D texts and ``answer`` is a letter."""
+
+    __slots__ = ()
+
+    def option(self, letter):
+        return f"{letter}) {self.options[LETTERS.index(letter)]}"
+
+
+class InvalidQuestion(ValueError):
+    """The model's question was unusable; ``reason`` says why, for the rejection metrics."""
+
+    def __init__(self, reason, detail):
+        super().__init__(f"{reason}: {detail}")
+        self.reason = reason
+
+
+def normalise_answer(answer):
+    """``"B"``, ``"b."``, ``"**B**"`` and ``"B) 3,000ft"`` are all the letter B."""
+    found = re.match(r"\W*([A-D])\b", str(answer).strip(), re.I)
+    if not found:
+        raise InvalidQuestion("answer", f"{answer!r} is not one of A-D")
+    return found.group(1).upper()
+
+
+def parse_question(raw, sop_ids=()):
+    """Validate a JSON reply into a ``Question``, or raise ``InvalidQuestion``.
+
+    There must be four distinct options with no catch-alls like "all of
+    the above", so exactly one of them is right. If ``sop_ids`` is given the
+    cited procedure must be one of them, which keeps the question on its
+    focus.
+    """
+    text = raw.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json")
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise InvalidQuestion("json", e) from None
+    if not isinstance(data, dict):
+        raise InvalidQuestion("json", "not an object")
+
+    stem = str(data.get("stem") or "").strip()
+    if not stem:
+        raise InvalidQuestion("stem", "missing")
+    options = data.get("options")
+    if not isinstance(options, dict) or not all(str(options.get(letter) or "").strip() for letter in LETTERS):
+        raise InvalidQuestion("options", "needs four options, A to D")
+    options = tuple(str(options[letter]).strip() for letter in LETTERS)
+    if len({option.lower() for option in options}) < len(LETTERS):
+        raise InvalidQuestion("options", "two options are the same")
+    if any(CATCH_ALLS.search(option) for option in options):
+        raise InvalidQuestion("options", "catch-all option")
+    answer = normalise_answer(data.get("answer", ""))
+
+    sop_id = str(data.get("sop_id") or "").strip().upper()
+    if sop_ids and sop_id not in sop_ids:
+        raise InvalidQuestion("sop", f"cites {sop_id or 'nothing'}, expected one of {', '.join(sorted(sop_ids))}")
+    return Question(stem, options, answer, sop_id)
+
+
+def question_id(question):
+    return hashlib.sha1(question.stem.strip().lower().encode()).hexdigest()
+
+
+class QuestionPool:
+    """Process-wide stock of ready-made questions, keyed by (section, focus).
+
+    Background workers keep every key topped up to ``target`` questions, and
+    start refilling once a key drops below ``low_water``. Serving a question
+    is a dictionary lookup; the model is only called inline if a key has run
+    completely dry. Each user's already-served questions are remembered so
+    that nobody is handed the same question twice.
+
+    Every generation is validated by ``parse_question`` against the SOP ids
+    its key may cite (``sop_ids``; a key without any is not checked). A
+    rejected one is retried, up to ``max_attempts`` calls that between them
+    get ``time_budget`` seconds: each call is handed what is left of it as
+    its deadline. If those run out, or there is no model at all, the
+    question comes from the ``fallback`` bank of hand-written questions
+    instead.
+    """
+
+    def __init__(self, model, prompts, target=6, low_water=3, workers=4, max_users=10_000, fallback=None,
+                 sop_ids=None, max_attempts=3, time_budget=15.0, prefetch_workers=None):
+        self._model = model
+        self._max_attempts = max_attempts
+        self._time_budget = time_budget
+        self._fallback = fallback or {}
+        self._prompts = dict(prompts)
+        self._sop_ids = dict(sop_ids or {})
+        self._target = target
+        self._low_water = low_water
+        self._max_users = max_users
+        self._lock = threading.Lock()
+        self._ready = {key: deque() for key in self._prompts}
+        self._in_flight = dict.fromkeys(self._prompts, 0)
+        self._unrecorded = set()  # keys a replay cassette has no recording for, so never refilled
+        self._seen = OrderedDict()  # user -> ids of questions already served to them
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="question-pool")
+        # Kept apart from the refill workers so a session's prefetch never queues behind a refill
+        self._prefetcher = ThreadPoolExecutor(
+            max_workers=prefetch_workers or workers, thread_name_prefix="question-prefetch"
+        )
+        for key in self._prompts:
+            self._top_up(key)
+
+    def generate(self, key):
+        deadline = time.monotonic() + self._time_budget
+        for attempt in range(1, self._max_attempts + 1):
+            response = self._model.generate_content(
+                self._prompts[key], generation_config=GENERATION_CONFIG, deadline=deadline
+            )
+            try:
+                question = parse_question(response.text, self._sop_ids.get(key, ()))
+            except InvalidQuestion as e:
+                metrics.inc("question_generations_total", result="rejected", reason=e.reason)
+                if attempt == self._max_attempts or time.monotonic() >= deadline:
+                    raise
+                log.info("Rejected a generated question for %s: %s", key, e)
+                continue
+            metrics.inc("question_generations_total", result="accepted")
+            return question
+
+    def take(self, key, user=None):
+        with self._lock:
+            seen = self._seen_by(user)
+            question = self._pop_unseen(key, seen)
+        if question is None:
+            question = self._generate_or_fallback(key, seen)
+        with self._lock:
+            seen.add(question_id(question))
+        self._top_up(key)
+        return question
+
+    def prefetch(self, key, user=None):
+        """Take a question for ``user`` in the background and return the Future."""
+        return self._prefetcher.submit(self.take, key, user)
+
+    def _generate_or_fallback(self, key, seen):
+        if self._model is not None and key not in self._unrecorded:
+            try:
+                return self.generate(key)  # Pool ran dry, so this user pays for one call
+            except Exception as e:
+                if not self._fallback.get(key):
+                    raise
+                log.warning("Question generation failed for %s, using the fallback bank: %s", key, e)
+        metrics.inc("questions_fallback_total")
+        bank = self._fallback[key]
+        return random.choice([q for q in bank if question_id(q) not in seen] or bank)
+
+    def _seen_by(self, user):
+        if user is None:
+            return set()
+        seen = self._seen.setdefault(user, set())
+        self._seen.move_to_end(user)
+        while len(self._seen) > self._max_users:
+            self._seen.popitem(last=False)
+        return seen
+
+    def _pop_unseen(self, key, seen):
+        ready = self._ready[key]
+        for question in ready:
+            if question_id(question) not in seen:
+                ready.remove(question)
+                return question
+        return None
+
+    def _top_up(self, key):
+        if self._model is None or key in self._unrecorded:
+            return
+        with self._lock:
+            stocked = len(self._ready[key]) + self._in_flight[key]
+            if stocked >= self._low_water:
+                return
+            missing = max(self._target - stocked, 0)
+            self._in_flight[key] += missing
+        for _ in range(missing):
+            self._executor.submit(self._fill_one, key)
+
+    def _fill_one(self, key):
+        question = None
+        try:
+            question = self.generate(key)
+        except CircuitOpenError:
+            pass  # The model is known to be down; take() serves the fallback bank meanwhile
+        except CassetteMiss:
+            with self._lock:
+                first = key not in self._unrecorded
+                self._unrecorded.add(key)  # The prompt never changes, so neither will the answer
+            if first:
+                log.info("The cassette has no question for %s; serving the fallback bank", key)
+        except InvalidQuestion as e:
+            log.warning("No usable question for %s after %d attempts: %s", key, self._max_attempts, e)
+        except TimeoutError as e:
+            log.warning("No question for %s within %ss: %s", key, self._time_budget, e)
+        except Exception:
+            log.exception("Question refill failed for %s", key)
+        finally:
+            with self._lock:
+                self._in_flight[key] -= 1
+                if question is not None:
+                    self._ready[key].append(question)
@@ -0,0 +1,210 @@
+"""Deadlines and circuit breakers for the model and database backends."""
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from skyhigh.limiter import is_throttled
+from skyhigh.metrics import metrics
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a backend that is known to be failing."""
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures.
+
+    While open every call is rejected at once. After ``reset_timeout``
+    seconds a single probe call is let through; its success closes the
+    breaker again and its failure re-opens it for another timeout.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._probing or time.monotonic() - self._opened_at < self._reset_timeout:
+                raise CircuitOpenError(f"{self.name} is unavailable")
+            self._probing = True  # Half open: this caller is the probe
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self._failure_threshold:
+                if self._opened_at is None:
+                    metrics.inc("circuit_opened_total", backend=self.name)
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def abandon(self):
+        """The caller gave up without an outcome; let someone else probe."""
+        with self._lock:
+            self._probing = False
+
+    def call(self, fn, *args, **kwargs):
+        self.before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.failure()
+            raise
+        self.success()
+        return result
+
+
+class GuardedModel:
+    """Puts a deadline and a circuit breaker in front of ``generate_content``.
+
+    A plain call must finish within ``timeout`` seconds. A stream must produce
+    its first chunk within ``first_token_timeout`` and finish within
+    ``timeout``. The caller is released when a deadline passes even if the
+    backend never answers.
+
+    It goes inside the ``ModelLimiter``, so deadlines start once a call has
+    been granted its slot; time spent queueing is neither timed nor counted
+    against the breaker. Quota pushbacks (429) are not counted either, as the
+    limiter backs off and retries them.
+
+    A plain call may pass a ``deadline`` (a ``time.monotonic()`` value) to
+    end it sooner than ``timeout``. Missing a deadline shorter than
+    ``timeout`` says nothing about the backend, so it is not a breaker
+    failure.
+
+    A call may also pass ``on_finish``, which is called exactly once when the
+    backend call has really finished. That can be well after a deadline let
+    the caller go, as the request itself cannot be cut short.
+    """
+
+    def __init__(self, model, breaker, timeout=30.0, first_token_timeout=10.0, workers=32):
+        self.model = model
+        self.breaker = breaker
+        self._timeout = timeout
+        self._first_token_timeout = first_token_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="model-deadline")
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def generate_content(self, prompt, stream=False, deadline=None, on_finish=None, **kwargs):
+        on_finish = on_finish or (lambda: None)
+        timeout = self._timeout
+        try:
+            if deadline is not None and not stream:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    raise TimeoutError("No time left for the model call")
+            self.breaker.before_call()
+            if stream:
+                return self._stream(prompt, kwargs, on_finish)
+            future = self._submit(self.model.generate_content, prompt, **kwargs)
+        except Exception:
+            on_finish()
+            raise
+        future.add_done_callback(lambda _: on_finish())
+        try:
+            response = future.result(timeout)
+        except FutureTimeout:
+            future.cancel()
+            metrics.inc("model_timeouts_total")
+            if timeout < self._timeout:
+                self.breaker.abandon()
+            else:
+                self.breaker.failure()
+            raise TimeoutError(f"Model call took longer than {timeout:.1f}s") from None
+        except Exception as e:
+            self._failed(e)
+            raise
+        self.breaker.success()
+        return response
+
+    def _failed(self, error):
+        if is_throttled(error):
+            self.breaker.abandon()
+        else:
+            self.breaker.failure()
+
+    def _submit(self, fn, *args, **kwargs):
+        try:
+            return self._executor.submit(fn, *args, **kwargs)
+        except RuntimeError:  # The interpreter is exiting and no longer starts threads
+            self.breaker.abandon()
+            raise CircuitOpenError("model is shutting down") from None
+
+    def _stream(self, prompt, kwargs, on_finish):
+        chunks = queue.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def pump():
+            response = None
+            try:
+                response = self.model.generate_content(prompt, stream=True, **kwargs)
+                for chunk in response:
+                    if stop.is_set():
+                        break
+                    chunks.put(chunk)
+                chunks.put(done)
+            except Exception as e:
+                chunks.put(e)
+            finally:
+                close = getattr(response, "close", None)
+                if close:
+                    close()
+                on_finish()
+
+        # Started here rather than on the first read, so on_finish is called even if no one reads
+        self._submit(pump)
+        return self._read(chunks, stop, done)
+
+    def _read(self, chunks, stop, done):
+        started = time.monotonic()
+        first = True
+        settled = False
+        try:
+            while True:
+                limit = self._first_token_timeout if first else self._timeout - (time.monotonic() - started)
+                try:
+                    item = chunks.get(timeout=max(limit, 0))
+                except queue.Empty:
+                    settled = True
+                    metrics.inc("model_timeouts_total")
+                    self.breaker.failure()
+                    raise TimeoutError("Model stream missed its deadline") from None
+                if item is done:
+                    settled = True
+                    self.breaker.success()
+                    return
+                if isinstance(item, Exception):
+                    settled = True
+                    self._failed(item)
+                    raise item
+                if first:
+                    first = False
+                    self.breaker.success()  # Tokens are flowing, so the backend is healthy
+                yield item
+        finally:
+            stop.set()
+            if not settled and first:
+                self.breaker.abandon()
@@ -0,0 +1,108 @@
+"""Chunking and lexical (BM25) retrieval over an SOP manual."""
+import math
+import re
+from collections import Counter, namedtuple
+
+SOP_ID = re.compile(r"\bSOP-[A-Z]+-\d+\b")
+SECTION = re.compile(r"^SECTION\s+(\d+)\s*:\s*(.*)$")
+STOPWORDS = frozenset(
+    "a an and are as at be by do does for from how i if in is it my of on or should the this to "
+    "what when where which who why will with you your".split()
+)
+
+Chunk = namedtuple("Chunk", "sop_id section section_title text")
+
+
+def parse_sop(text):
+    """Split an SOP manual into one chunk per ``SOP-XXX-NN`` procedure."""
+    chunks = []
+    section, section_title = 0, ""
+    sop_id, lines = None, []
+
+    def flush():
+        if sop_id:
+            chunks.append(Chunk(sop_id, section, section_title, "\n".join(lines)))
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        heading = SECTION.match(line)
+        if heading:
+            flush()
+            sop_id, lines = None, []
+            section, section_title = int(heading.group(1)), heading.group(2).strip()
+            continue
+        found = SOP_ID.match(line)
+        if found:
+            flush()
+            sop_id, lines = found.group(0), []
+        if sop_id:
+            lines.append(line)
+    flush()
+    return chunks
+
+
+def tokenize(text):
+    text = re.sub(r"(?<=\d),(?=\d)", "", text.lower())  # 3,000ft -> 3000ft
+    tokens = []
+    for token in re.findall(r"[a-z]+|\d+", text):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def format_context(chunks):
+    """Render retrieved chunks back into SOP-looking text for a prompt."""
+    parts, section = [], None
+    for chunk in sorted(chunks, key=lambda c: (c.section, c.sop_id)):
+        if chunk.section != section:
+            section = chunk.section
+            parts.append(f"SECTION {chunk.section}: {chunk.section_title}")
+        parts.append(chunk.text)
+    return "\n\n".join(parts)
+
+
+class SopIndex:
+    """In-memory BM25 index over SOP chunks.
+
+    Built once per manual. A query that names a procedure id outright
+    (``SOP-CRIS-03``) always gets that procedure first.
+    """
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = list(chunks)
+        self.by_id = {chunk.sop_id: chunk for chunk in self.chunks}
+        self._k1, self._b = k1, b
+        self._docs = [Counter(tokenize(f"{c.section_title} {c.text}")) for c in self.chunks]
+        self._lengths = [sum(doc.values()) for doc in self._docs]
+        self._avg_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0
+        df = Counter(token for doc in self._docs for token in doc)
+        n = len(self._docs)
+        self._idf = {token: math.log(1 + (n - count + 0.5) / (count + 0.5)) for token, count in df.items()}
+
+    @classmethod
+    def from_text(cls, text):
+        return cls(parse_sop(text))
+
+    def search(self, query, k=3, section=None):
+        named = [self.by_id[i] for i in SOP_ID.findall(query) if i in self.by_id]
+        terms = set(tokenize(query))
+        scored = []
+        for chunk, doc, length in zip(self.chunks, self._docs, self._lengths):
+            if section is not None and chunk.section != section:
+                continue
+            score = 0.0
+            for term in terms & doc.keys():
+                tf = doc[term]
+                norm = tf + self._k1 * (1 - self._b + self._b * length / self._avg_length)
+                score += self._idf[term] * tf * (self._k1 + 1) / norm
+            if score > 0:
+                scored.append((score, chunk))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        results = [c for c in named if section is None or c.section == section]
+        results += [c for _, c in scored if c not in results]
+        return results[:k]
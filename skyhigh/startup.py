@@ -0,0 +1,69 @@
+"""Process start-up costs, and background warm-up of the heavy SDKs."""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from skyhigh.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """How long each import and initialisation step took, in the order they first ran."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._steps = {}  # step -> (seconds, where it ran)
+        self._warming = None
+
+    @contextmanager
+    def timed(self, step):
+        started = time.perf_counter()
+        yield
+        self.record(step, time.perf_counter() - started)  # Failed steps are not recorded
+
+    def record(self, step, seconds, where=None):
+        if where is None:
+            where = "background" if threading.current_thread() is self._warming else "script"
+        with self._lock:
+            if step in self._steps:
+                return  # Only the first, cold, run of a step is interesting
+            self._steps[step] = (seconds, where)
+        metrics.observe("startup_seconds", seconds, step=step)
+        log.info("Startup: %s took %.3fs (%s)", step, seconds, where)
+
+    def mark(self, step):
+        """Record the time from process start to now, e.g. for the first paint."""
+        self.record(step, time.perf_counter() - self.started, "since start")
+
+    def rows(self):
+        with self._lock:
+            return [
+                {"step": step, "seconds": round(seconds, 3), "where": where}
+                for step, (seconds, where) in self._steps.items()
+            ]
+
+    def warm_up(self, *steps):
+        """Run each ``(name, fn)`` step once per process, in order, on a daemon thread.
+
+        Every step is timed. A failure is only logged: the page that needs
+        the step runs it again in the foreground and reports the error there.
+        """
+        with self._lock:
+            if self._warming is not None:
+                return
+            self._warming = threading.Thread(target=self._warm, args=(steps,), name="warm-up", daemon=True)
+        self._warming.start()
+
+    def _warm(self, steps):
+        for step, fn in steps:
+            try:
+                with self.timed(step):
+                    fn()
+            except Exception:
+                log.warning("Warm-up step %r failed", step, exc_info=True)
+
+
+startup = StartupReport()
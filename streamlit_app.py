@@ -1,11 +1,56 @@
+import hmac
+import os
+import time
+_rerun_started = time.perf_counter()
+
 import streamlit as st
-from supabase import create_client, Client
+from skyhigh.questions import Question, QuestionPool
+from skyhigh.retrieval import format_context
+from skyhigh.corpus import Corpus
+from skyhigh.conversation import Conversation
+from skyhigh.answers import AnswerCache
+from skyhigh.progress import ProgressStore
+from skyhigh.metrics import InstrumentedModel, metrics
+from skyhigh.limiter import ModelLimiter
+from skyhigh.resilience import CircuitBreaker, GuardedModel
+from skyhigh.backends import open_backend
+from skyhigh.startup import startup
+from skyhigh.analytics import (
+    COMPLETION_BUCKETS, CohortStats, answer_event, answer_rows, completion_event, completion_rows, funnel,
+)
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
 
+# --- METRICS ---
+# Timings for reruns, pages, model and database calls. Set METRICS_ENABLED = false in the
+# secrets to switch them off, and METRICS_PORT to serve them for scraping at /metrics.
+metrics.enabled = st.secrets.get("METRICS_ENABLED", True)
+
+@st.cache_resource(show_spinner=False)
+def start_metrics_server(port):
+    return metrics.serve(port)
+
+if metrics.enabled and st.secrets.get("METRICS_PORT"):
+    start_metrics_server(int(st.secrets["METRICS_PORT"]))
 
 # --- SUPABASE INIT ---
-url: str = st.secrets["SUPABASE_URL"]
-key: str = st.secrets["SUPABASE_KEY"]
-supabase: Client = create_client(url, key)
+# One progress store per server process, shared by every session. It owns the (thread safe)
+# Supabase client, caches each trainee's step and writes progress in the background.
+# Every request has a deadline, and a breaker stops calling Supabase while it is down.
+# The SDK is only imported when the store first connects (at login, or in the warm-up below).
+@st.cache_resource(show_spinner=False)
+def get_progress_store() -> ProgressStore:
+    url: str = st.secrets["SUPABASE_URL"]
+    key: str = st.secrets["SUPABASE_KEY"]
+    timeout = float(st.secrets.get("DB_TIMEOUT_SECONDS", 5))
+
+    def connect():
+        with startup.timed("import supabase"):
+            from supabase import ClientOptions, create_client
+        return create_client(url, key, options=ClientOptions(postgrest_client_timeout=timeout))
+    return ProgressStore(connect, breaker=CircuitBreaker("database"))
+
+progress_store = get_progress_store()
 
 st.set_page_config(
     page_title="SkyHigh AI Training",
@@ -57,41 +102,330 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-import vertexai
-import time
-from vertexai.generative_models import GenerativeModel
-from google.oauth2 import service_account
-if "count_m1" not in st.session_state:
-    st.session_state.count_m1 = 0
-if "count_m2" not in st.session_state:
-    st.session_state.count_m2 = 0
-if "count_m3" not in st.session_state:
-    st.session_state.count_m3 = 0
-
 
 
 # --- 1. INITIALIZATION & AUTH ---
 # This part stays common to all sections
+# One model per process, built on first use: limiter -> deadline and breaker -> MODEL_BACKEND
+# (see skyhigh/limiter.py, resilience.py and backends.py).
+MODEL_MAX_CONCURRENT = int(st.secrets.get("MODEL_MAX_CONCURRENT", 16))
+
+def current_session_id():
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else None
+
+@st.cache_resource(show_spinner=False)
+def get_vertex_client():
+    kind = st.secrets.get("MODEL_BACKEND", "vertex")
+
+    def connect_vertex():
+        with startup.timed("import vertexai"):
+            from skyhigh.clients import VertexClient
+        return VertexClient(st.secrets["gcp_service_account"])
+
+    with metrics.span("vertex_init"):
+        backend = open_backend(
+            kind,
+            cassette=st.secrets.get("MODEL_CASSETTE", "model_cassette.jsonl"),
+            live=connect_vertex,
+        )
+    if kind == "replay":  # A cassette answers instantly and has no quota, so it skips the guards
+        return InstrumentedModel(backend, metrics)
+    first_token_timeout = float(st.secrets.get("MODEL_FIRST_TOKEN_TIMEOUT_SECONDS", 10))
+    guarded = GuardedModel(
+        backend,
+        CircuitBreaker("model"),
+        timeout=float(st.secrets.get("MODEL_TIMEOUT_SECONDS", 30)),
+        first_token_timeout=first_token_timeout,
+        workers=MODEL_MAX_CONCURRENT,  # One thread per limiter slot
+    )
+    limiter = ModelLimiter(
+        guarded,
+        session_id=current_session_id,
+        max_concurrent=MODEL_MAX_CONCURRENT,
+        rate=float(st.secrets.get("MODEL_RATE_PER_SEC", 10)),
+        burst=int(st.secrets.get("MODEL_BURST", 20)),
+        first_token_timeout=first_token_timeout,  # Also bounds a stream's wait for a slot
+    )
+    return InstrumentedModel(limiter, metrics)
+
 def init_vertex():
     try:
-        creds_dict = st.secrets["gcp_service_account"]
-        credentials = service_account.Credentials.from_service_account_info(creds_dict)
-        vertexai.init(project="ai-training-demo-1-482218", location="europe-west1", credentials=credentials)
-        return GenerativeModel("gemini-2.0-flash-001")
+        return get_vertex_client()
     except Exception as e:
         st.error(f"Cloud Connection Error: {e}")
         return None
 
-model = init_vertex()
+# --- SOP MANUALS ---
+# Every <name>_sop.txt in SOP_DIR (default: next to this script) is a client's manual. A manual
+# is read, split into its SOP-XXX-NN procedures and indexed on first use, then shared by every
+# session; an edited file is re-read on the next rerun. Each session is bound to one manual,
+# picked by the ?manual= link it arrived with. Prompts then carry only the few procedures
+# relevant to the question, not the whole manual.
+DEFAULT_MANUAL = "skyhigh"
+MAX_ACTIVE_MANUALS = int(st.secrets.get("MAX_ACTIVE_MANUALS", 32))
+
+@st.cache_resource(show_spinner=False)
+def get_corpus():
+    root = st.secrets.get("SOP_DIR", os.path.dirname(os.path.abspath(__file__)))
+    return Corpus(root, max_loaded=MAX_ACTIVE_MANUALS)
+
+corpus = get_corpus()
+if "manual" not in st.session_state:
+    requested = st.query_params.get("manual", DEFAULT_MANUAL)
+    st.session_state.manual = requested if requested in corpus.names() else DEFAULT_MANUAL
+try:
+    with startup.timed("sop manual"):
+        manual = corpus.get(st.session_state.manual)
+except FileNotFoundError:
+    st.error(f"SOP manual '{st.session_state.manual}' not found.")
+    st.stop()
+sop_index = manual.index
+SOP_HASH = manual.sop_hash
+
+def sop_context(query, k=3, section=None):
+    return format_context(sop_index.search(query, k=k, section=section))
+
+# --- MENTOR ANSWER CACHE ---
+# One per manual, shared by every session on it. Answers are tied to the manual's version, so
+# editing it clears them.
+@st.cache_resource(show_spinner=False, max_entries=MAX_ACTIVE_MANUALS)
+def get_answer_cache(manual_name):
+    return AnswerCache()
+
+answer_cache = get_answer_cache(manual.name)
+
+# --- ASSESSMENT MODULES ---
+# Everything that differs between the training modules lives in this registry; one engine
+# (run_module, below) renders all of them. "foci" are the assessment questions in order:
+# a trainee must answer pass_mark in a row, each against the next focus. A generated question
+# is only accepted if it tests one of its focus's "sop_ids".
+MODULES = [
+    {
+        "section": 1,
+        "page": "training_module_1",
+        "nav_title": "1. Pre-Flight",
+        "icon": "🛠️",
+        "title": "Section 1: Equipment & Pre-Flight",
+        "greeting": "Ready for takeoff, {user_name}?",
+        "video": "https://www.youtube.com/watch?v=74DSBbwm_UY",
+        "intro": """
+    ### First, watch the training video above. 
+    There is a small amount of information to take in, so we have highlighted the important bits with friendly arrows!
+    
+    ### Then, try the assessment below.
+    You'll need to get 2 right answers in a row to pass this section. All of the questions are generated uniquely for each user, to make sure that the assessment is accurate!  
+    """,
+        "pass_mark": 2,
+        "foci": [
+            {"sop_ids": ["SOP-ENV-01"],
+             "prompt": "Focus strictly on the cumulo-nimbus WEATHER condition mentioned in SOP-ENV-01."},
+            {"sop_ids": ["SOP-GEAR-02"],
+             "prompt": "Focus strictly on HARNESS and ALTIMETER checks found in SOP-GEAR-02."},
+        ],
+        "correct": "Great job! One more.",
+        "passed": "🎯 Mastery achieved! Phase 2: The Jump is now unlocked.",
+        "incorrect": "❌ Incorrect. Gear safety is binary. Progress reset.",
+    },
+    {
+        "section": 2,
+        "page": "training_module_2",
+        "nav_title": "2. The Jump",
+        "icon": "🍌",
+        "title": "Section 2: The Jump & Maneuvers",
+        "locked": "🔒 Complete Section 1 to unlock this module.",
+        "video": "https://www.youtube.com/watch?v=iQcRGqhIbLo",
+        "intro": """
+        ### Like before, watch the training video above. 
+        Shorter and easier one this time!
+    
+        ### Then, try the assessment below.
+        You'll need to get 2 right answers in a row to pass this section. Can you do it first go?  
+        """,
+        "pass_mark": 2,
+        "foci": [
+            # Hard isolation: The AI is forbidden from mentioning navigation
+            {"sop_ids": ["SOP-BODY-01"], "prompt": """
+            Focus EXCLUSIVELY on the 'Stable Arch' (The Banana) body position and aircraft exit. 
+            STRICT PROHIBITION: Do NOT mention toggles, steering, turns, or flares. 
+            If the question mentions a parachute handle or steering, it is a failure of this instruction.
+            """},
+            # Shift focus to landing patterns specifically to avoid basic steering loops
+            {"sop_ids": ["SOP-NAV-01"], "prompt": """
+            Focus EXCLUSIVELY on the falre technique (SOP-NAV-01). 
+            STRICT PROHIBITION: Do NOT ask about basic left/right turns or 'how to steer'. 
+            Focus on altitudes for the downwind or base leg.
+            """},
+        ],
+        "correct": "Solid form! One more.",
+        "passed": "🎯 Mastery achieved! Phase 3: Crisis Mgmt is now unlocked.",
+        "incorrect": "❌ Incorrect. Precision in the air is vital. Progress reset.",
+    },
+    {
+        "section": 3,
+        "page": "training_module_3",
+        "nav_title": "3. Crisis Mgmt",
+        "icon": "🚨",
+        "title": "Phase 3: Crisis Management",
+        "locked": "🔒 Complete Phase 2 to unlock this module.",
+        "video": "https://www.youtube.com/watch?v=3qDBFceGupU",
+        "intro": """
+        ### Last video on this course! 
+        Almost there!
+    
+        ### And then, your final assessment below.
+        You are just 2 correct answers away from one of the most pointless certifications you will ever get. But you do get balloons with it.
+        """,
+        "pass_mark": 2,
+        "foci": [
+            {"sop_ids": ["SOP-CRIS-02"], "prompt": "Focus strictly on water landings covered in SOP-CRIS-02."},
+            {"sop_ids": ["SOP-CRIS-03"], "prompt": "Focus strictly on cut away procedure covered in SOP-CRIS-03."},
+        ],
+        "correct": "Cool under pressure! One more.",
+        "passed": "🎯 Course Complete! You are now cleared for the Live Jump Mentor.",
+        "incorrect": "❌ Incorrect. In a crisis, there is no room for error. Progress reset.",
+    },
+]
+MODULES_BY_SECTION = {module["section"]: module for module in MODULES}
+
+# The registry is written against the SkyHigh manual's procedures. A session on any other
+# manual gets no assessments (their foci and sop_ids would not match it) and goes straight
+# to the Live Jump Mentor, which answers from its own manual.
+ASSESSED_MANUALS = {DEFAULT_MANUAL}
+assessed = manual.name in ASSESSED_MANUALS
+
+# (section, question number) -> focus text
+QUESTION_FOCUS = {
+    (module["section"], n): focus["prompt"] for module in MODULES for n, focus in enumerate(module["foci"])
+}
+
+# (section, question number) -> the procedures its questions may cite. Only ids the manual
+# still has are checked, so dropping a procedure from it stops the check, not the questions.
+QUESTION_SOPS = {
+    (module["section"], n): frozenset(sop_id for sop_id in focus["sop_ids"] if sop_id in sop_index.by_id)
+    for module in MODULES for n, focus in enumerate(module["foci"])
+}
 
-# Load SOP context once
-def load_sop():
-    try:
-        with open("skyhigh_sop.txt", "r") as f:
-            return f.read()
-    except:
-        return "SOP File not found."
-SOP_CONTENT = load_sop()
+# Hand-written questions served when the model is unreachable
+FALLBACK_QUESTIONS = {
+    (1, 0): [
+        Question("Per SOP-ENV-01, which condition means you must not board the aircraft?",
+                 ("Cumulonimbus formations visible within a 10-mile radius", "Ground wind of 12 knots",
+                  "Cloud cover at 4,000ft", "Light rain at the drop zone"), "A", "SOP-ENV-01"),
+        Question("Per SOP-ENV-01, above what ground wind speed is boarding forbidden?",
+                 ("5 knots", "10 knots", "20 knots", "40 knots"), "C", "SOP-ENV-01"),
+    ],
+    (1, 1): [
+        Question("Per SOP-GEAR-02, how often must a jumper check their altimeter?",
+                 ("Every 5 seconds", "Every 30 seconds", "Once, at exit", "Only below 3,000ft"), "A", "SOP-GEAR-02"),
+        Question("Per SOP-GEAR-02, what is the Mandatory Deployment Altitude?",
+                 ("1,000ft", "2,000ft", "3,000ft", "5,000ft"), "C", "SOP-GEAR-02"),
+    ],
+    (2, 0): [
+        Question("Per SOP-BODY-01, what is the correct Stable Arch position on exit?",
+                 ("Knees tucked to the chest", "Hips pushed forward, head back, limbs symmetrical",
+                  "Head down, arms by the sides", "Legs crossed, arms folded"), "B", "SOP-BODY-01"),
+        Question("Per SOP-BODY-01, what happens if a jumper fails to arch after exit?",
+                 ("A Tumble", "A Flare", "A Cut-away", "Line twists"), "A", "SOP-BODY-01"),
+    ],
+    (2, 1): [
+        Question("Per SOP-NAV-01, at what height above ground is the Flare performed?",
+                 ("10ft", "50ft", "100ft", "1,000ft"), "A", "SOP-NAV-01"),
+        Question("Per SOP-NAV-01, how is the Flare performed?",
+                 ("Pull the left toggle only", "Pull the right toggle only",
+                  "Pull both toggles down simultaneously", "Release both toggles"), "C", "SOP-NAV-01"),
+    ],
+    (3, 0): [
+        Question("Per SOP-CRIS-02, when should the chest strap be unclipped for a water landing?",
+                 ("Immediately, while still in the air", "Once the feet touch the water",
+                  "After the canopy is in the water", "Never"), "A", "SOP-CRIS-02"),
+        Question("Per SOP-CRIS-02, when may the leg straps be unclipped for a water landing?",
+                 ("At exit", "At 3,000ft", "When the feet touch the water", "Before the chest strap"), "C", "SOP-CRIS-02"),
+    ],
+    (3, 1): [
+        Question("Per SOP-CRIS-03, which handle releases the main chute in a cut-away?",
+                 ("The Silver handle", "The Red handle", "The Main Ripcord", "Either toggle"), "B", "SOP-CRIS-03"),
+        Question("Per SOP-CRIS-03, what must you do immediately after pulling the Red handle?",
+                 ("Flare", "Check the altimeter", "Pull the Reserve handle (Silver)", "Bicycle kick"), "C", "SOP-CRIS-03"),
+    ],
+}
+
+QUESTION_TEMPLATE = """
+Based ONLY on SECTION {section} of this SOP: {context}, {focus},
+STRICT RULE: Only ONE of the four lettered options (A, B, C, or D) can be factually correct according to the SOP.
+            The other three options must be definitively WRONG based on the text, as the user will be answering with radio buttons and cannot mutiple select. 
+            Avoid "All of the above", "some of the above" or "None of the above" scenarios.
+            Output JSON: "stem" is the question without its options, "options" maps A, B, C and D to the option texts,
+            "answer" is the letter of the correct option and "sop_id" is the SOP-XXX-NN procedure the question tests.
+"""
+
+# Compiled once per SOP version: each prompt carries only procedures from its own section
+@st.cache_resource(show_spinner=False)
+def compile_question_prompts(sop_hash):
+    return {
+        (section, n): QUESTION_TEMPLATE.format(
+            section=section, focus=focus, context=sop_context(focus, k=2, section=section)
+        )
+        for (section, n), focus in QUESTION_FOCUS.items()
+    }
+
+QUESTION_PROMPTS = compile_question_prompts(SOP_HASH)
+
+# One pool per manual, filled in the background so questions are ready before anyone asks.
+# Prefetches get as many threads as the model has slots, so they are never the bottleneck.
+@st.cache_resource(show_spinner=False, max_entries=MAX_ACTIVE_MANUALS)
+def get_question_pool(_model, prompts, sop_ids, fallback):
+    return QuestionPool(
+        _model, prompts, sop_ids=sop_ids, fallback=fallback, prefetch_workers=MODEL_MAX_CONCURRENT
+    )
+
+# Without a model the fallback bank is all there is. Cached apart from the live pool, so
+# the live pool is still built as soon as Vertex can be reached again.
+@st.cache_resource(show_spinner=False, max_entries=MAX_ACTIVE_MANUALS)
+def get_fallback_pool(prompts, fallback):
+    return QuestionPool(None, prompts, fallback=fallback)
+
+def current_question_pool():
+    model = init_vertex()
+    if model:
+        return get_question_pool(model, QUESTION_PROMPTS, QUESTION_SOPS, FALLBACK_QUESTIONS)
+    return get_fallback_pool(QUESTION_PROMPTS, FALLBACK_QUESTIONS)
+
+# --- SPECULATIVE PREFETCH ---
+# While a trainee reads one question, the next one they will need is fetched in the
+# background and parked in their session, so it is already there after a correct answer.
+# A prefetch that is still running when its question is needed only gets PREFETCH_WAIT_SECONDS
+# more; after that the trainee takes their own question rather than wait on it.
+PREFETCH_WAIT_SECONDS = 0.5
+
+def next_question_key(section, count):
+    if (section, count + 1) in QUESTION_FOCUS:
+        return (section, count + 1)
+    if (section + 1, 0) in QUESTION_FOCUS:
+        return (section + 1, 0)
+    return None
+
+def prefetch_next_question(section, count):
+    key = next_question_key(section, count)
+    prefetched = st.session_state.setdefault("prefetched", {})
+    if key is not None and key not in prefetched:
+        prefetched[key] = current_question_pool().prefetch(key, st.session_state.get("user_email"))
+
+def take_question(key):
+    future = st.session_state.get("prefetched", {}).pop(key, None)
+    if future is not None and not future.cancel():  # Still queued means cancelled, so take directly
+        try:
+            question = future.result(timeout=PREFETCH_WAIT_SECONDS)
+        except Exception:  # Still generating, or it failed
+            metrics.inc("question_prefetch_total", result="missed")
+        else:
+            metrics.inc("question_prefetch_total", result="hit")
+            return question
+    return current_question_pool().take(key, st.session_state.get("user_email"))
+
+def discard_prefetched():
+    for future in st.session_state.pop("prefetched", {}).values():
+        future.cancel()
 
 
 
@@ -101,9 +435,24 @@ if "training_step" not in st.session_state:
     st.session_state.training_step = 1  # 1: Equipment, 2: Flight, 3: Crisis
 if "quiz_active" not in st.session_state:
     st.session_state.quiz_active = False
+for module in MODULES:
+    if f"count_m{module['section']}" not in st.session_state:
+        st.session_state[f"count_m{module['section']}"] = 0
 
 # --- 3. PAGE DEFINITIONS ---
 
+# Messages (and balloons) that outlive one st.rerun / st.switch_page, so a stage
+# transition can move on immediately instead of sleeping on the script thread
+def flash(kind, message, balloons=False):
+    st.session_state.flash = (kind, message, balloons)
+
+def show_flash():
+    if "flash" in st.session_state:
+        kind, message, balloons = st.session_state.pop("flash")
+        getattr(st, kind)(message)
+        if balloons:
+            st.balloons()
+
 
 # --- Home Screen
 
@@ -148,37 +497,23 @@ def welcome_home():
 
         if st.button("Begin / Resume Training"):
             if user_name and user_email:
-                # 1. Fetch from Supabase
-                response = supabase.table("skyhigh_users").select("training_step").eq("email", user_email).execute()
+                # 1. Fetch (or create) the trainee in a single round trip
+                training_step = progress_store.resume(user_name, user_email)
                 
-                if response.data:
-                    training_step = response.data[0]["training_step"]
-                    st.success(f"Welcome back, {user_name}! Resuming at Stage {training_step}.")
+                if not progress_store.verified(user_email):
+                    flash("warning", f"Welcome, {user_name}! We can't load saved progress right now, so you're starting at Stage {training_step}. Anything you pass will still be saved.")
+                elif training_step > 1:
+                    flash("success", f"Welcome back, {user_name}! Resuming at Stage {training_step}.", balloons=True)
                 else:
-                    training_step = 1
-                    st.success(f"Welcome to SkyHigh, {user_name}! Starting your journey.")
+                    flash("success", f"Welcome to SkyHigh, {user_name}! Starting your journey.", balloons=True)
 
                 # 2. Sync session state
                 st.session_state.user_name = user_name
                 st.session_state.user_email = user_email
                 st.session_state.training_step = training_step
-                
-                # 3. Perform the database upsert
-                data = {"full_name": user_name, "email": user_email, "training_step": training_step}
-                supabase.table("skyhigh_users").upsert(data, on_conflict="email").execute()
 
-                st.balloons()
-                time.sleep(1.5) # Give them a second to see the success message
-                
                 # 🚀 THE SAFE JUMP: Teleport based on the step
-                if training_step == 1:
-                    st.switch_page(m1_p)
-                elif training_step == 2:
-                    st.switch_page(m2_p)
-                elif training_step == 3:
-                    st.switch_page(m3_p)
-                elif training_step >= 4:
-                    st.switch_page(grad_p)
+                st.switch_page(page_for_step(training_step))
             else:
                 st.warning("Please enter your name and email to continue.")
 
@@ -205,225 +540,178 @@ def welcome_home():
 
 
 
-# --- PHASE 1: EQUIPMENT ---
-def training_module_1():
-    st.title("Section 1: Equipment & Pre-Flight")
-    st.write(f"Ready for takeoff, {st.session_state.user_name}?")
-    st.video("https://www.youtube.com/watch?v=74DSBbwm_UY")
+# --- TRAINING MODULES ---
+# One engine for every module in MODULES
+def run_module(module):
+    section = module["section"]
+    count_key = f"count_m{section}"
+    if not assessed:
+        st.title(module["title"])
+        st.info(f"Assessments are only available for the {DEFAULT_MANUAL} manual so far. "
+                f"Ask the Live Jump Mentor about the {manual.name} procedures instead.")
+        return
+    if st.session_state.training_step < section:
+        st.warning(module["locked"])
+        return
 
-    st.markdown("""
-    ### First, watch the training video above. 
-    There is a small amount of information to take in, so we have highlighted the important bits with friendly arrows!
-    
-    ### Then, try the assessment below.
-    You'll need to get 2 right answers in a row to pass this section. All of the questions are generated uniquely for each user, to make sure that the assessment is accurate!  
-    """)
-    
-    st.write(f"**Mastery Level:** {st.session_state.count_m1} / 2 Correct")
-    st.progress(st.session_state.count_m1 / 2)
+    st.title(module["title"])
+    if "greeting" in module:
+        st.write(module["greeting"].format(user_name=st.session_state.user_name))
+    st.video(module["video"])
+    st.markdown(module["intro"])
 
-    if st.session_state.count_m1 == 0:
-        focus1 = "Focus strictly on the cumulo-nimbus WEATHER condition mentioned in SOP-ENV-01."
-    else:
-        focus1 = "Focus strictly on HARNESS and ALTIMETER checks found in SOP-GEAR-02."
+    count = st.session_state[count_key]
+    pass_mark = module["pass_mark"]
+    st.write(f"**Mastery Level:** {count} / {pass_mark} Correct")
+    st.progress(count / pass_mark)
 
-    if st.button("Start Section 1 Assessment") or st.session_state.quiz_active:
+    if st.button(f"Start Section {section} Assessment") or st.session_state.quiz_active:
         st.session_state.quiz_active = True
+        st.session_state.setdefault(f"started_m{section}", time.time())
         
-        if "current_question_text" not in st.session_state:
-            # Focus prompt on SOP-GEAR
-            prompt = f"""
-Based ONLY on SECTION 1 of this SOP: {SOP_CONTENT}, {focus1},
-STRICT RULE: Only ONE of the four lettered options (A, B, C, or D) can be factually correct according to the SOP.
-            The other three options must be definitively WRONG based on the text, as the user will be answering with radio buttons and cannot mutiple select. 
-            Avoid "All of the above", "some of the above" or "None of the above" scenarios.
-            You MUST include the lettered answer options in the question.
-            Output: QUESTION: [text] ANSWER_KEY: [Letter] 
-"""
-            raw_response = model.generate_content(prompt).text
-            st.session_state.current_question_text = raw_response.split("ANSWER_KEY:")[0]
-            st.session_state.correct_answer = raw_response.split("ANSWER_KEY:")[1].strip()
-
-        st.info(st.session_state.current_question_text)
-        user_choice = st.radio("Select answer:", ["A", "B", "C", "D"], index=None, key=f"m1_radio_{st.session_state.count_m1}")
+        if "current_question" not in st.session_state:
+            # Served straight from the shared pool, one focus per question
+            focus = (section, min(count, len(module["foci"]) - 1))
+            try:
+                question = take_question(focus)
+            except Exception:  # No model, and the fallback bank has nothing for this focus
+                st.error("Questions can't be generated right now. Please try again in a moment.")
+                st.session_state.quiz_active = False
+                return
+            st.session_state.current_question = question
+            st.session_state.correct_answer = question.answer
+
+        question = st.session_state.current_question
+        st.info(question.stem)
+        prefetch_next_question(section, count)
+        user_choice = st.radio(
+            "Select answer:", ["A", "B", "C", "D"], index=None, format_func=question.option, key=f"m{section}_radio_{count}"
+        )
         
-        if st.button("Submit Section 1 Answer"):
-            if user_choice == st.session_state.correct_answer:
-                st.session_state.count_m1 += 1
-                if st.session_state.count_m1 >= 2:
-                    st.balloons()
-                    st.success("🎯 Mastery achieved! Phase 2: The Jump is now unlocked.")
-                    st.session_state.training_step = 2
+        if st.button(f"Submit Section {section} Answer"):
+            correct = user_choice == st.session_state.correct_answer
+            question_no = min(count, len(module["foci"]) - 1) + 1
+            metrics.inc("assessment_answers_total", section=section, question=question_no,
+                        result="correct" if correct else "reset")
+            if "user_email" in st.session_state:
+                progress_store.record(answer_event(st.session_state.user_email, section, question_no, correct))
+            if correct:
+                st.session_state[count_key] += 1
+                if st.session_state[count_key] >= pass_mark:
+                    flash("success", module["passed"], balloons=True)
+                    started = st.session_state.pop(f"started_m{section}", None)
+                    if started is not None:
+                        seconds = time.time() - started
+                        metrics.observe("module_completion_seconds", seconds, section=section)
+                        if "user_email" in st.session_state:
+                            progress_store.record(completion_event(st.session_state.user_email, section, seconds))
+                    st.session_state.training_step = section + 1
                     st.session_state.quiz_active = False
-                    del st.session_state.current_question_text 
-                    # 2. Add a pause so they see the balloons and success message
-                    time.sleep(3) 
-                    # 3. Jump to next module
-                    st.switch_page(st.Page(training_module_2))
+                    if "user_email" in st.session_state:
+                        # Queued for the background writer, so submitting never waits on the database
+                        progress_store.save(st.session_state.user_name, st.session_state.user_email, section + 1)
+                    del st.session_state.current_question
+                    # Jump straight to the next module, or the grad page after the last one
+                    st.switch_page(page_for_step(section + 1))
                 else:
-                    st.toast("Great job! One more.", icon="✅")
-                    del st.session_state.current_question_text
+                    st.toast(module["correct"], icon="✅")
+                    del st.session_state.current_question
                     st.rerun()
             else:
-                st.error("❌ Incorrect. Gear safety is binary. Progress reset.")
-                time.sleep(2)
-                st.session_state.count_m1 = 0
-                del st.session_state.current_question_text
+                flash("error", module["incorrect"])
+                st.session_state[count_key] = 0
+                del st.session_state.current_question
                 st.rerun()
 
-# --- PHASE 2: MANEUVER ---
-def training_module_2():
-    if st.session_state.training_step < 2:
-        st.warning("🔒 Complete Section 1 to unlock this module.")
-    else:
-        st.title("Section 2: The Jump & Maneuvers")
-        st.video("https://www.youtube.com/watch?v=iQcRGqhIbLo")
-
-        st.markdown("""
-        ### Like before, watch the training video above. 
-        Shorter and easier one this time!
-    
-        ### Then, try the assessment below.
-        You'll need to get 2 right answers in a row to pass this section. Can you do it first go?  
-        """)
-        
-        st.write(f"**Mastery Level:** {st.session_state.count_m2} / 2 Correct")
-        st.progress(st.session_state.count_m2 / 2)
-
-        if st.session_state.count_m2 == 0:
-        # Hard isolation: The AI is forbidden from mentioning navigation
-            focus2 = """
-            Focus EXCLUSIVELY on the 'Stable Arch' (The Banana) body position and aircraft exit. 
-            STRICT PROHIBITION: Do NOT mention toggles, steering, turns, or flares. 
-            If the question mentions a parachute handle or steering, it is a failure of this instruction.
-            """
-        else:
-        # Shift focus to landing patterns specifically to avoid basic steering loops
-            focus2 = """
-            Focus EXCLUSIVELY on the falre technique (SOP-NAV-01). 
-            STRICT PROHIBITION: Do NOT ask about basic left/right turns or 'how to steer'. 
-            Focus on altitudes for the downwind or base leg.
-            """
-
-        if st.button("Start Section 2 Assessment") or st.session_state.quiz_active:
-            st.session_state.quiz_active = True
-            if "current_question_text" not in st.session_state:
-                # Focus prompt on Body Position and Flare
-                prompt = f"""
-Based ONLY on SECTION 2 of this SOP: {SOP_CONTENT}, {focus2},
-STRICT RULE: Only ONE of the four lettered options (A, B, C, or D) can be factually correct according to the SOP.
-            The other three options must be definitively WRONG based on the text, as the user will be answering with radio buttons and cannot mutiple select. 
-            Avoid "All of the above" or "None of the above" scenarios.
-            You MUST include the lettered answer options in the question.
-            Output: QUESTION: [text] ANSWER_KEY: [Letter]
-"""
-                raw_response = model.generate_content(prompt).text
-                st.session_state.current_question_text = raw_response.split("ANSWER_KEY:")[0]
-                st.session_state.correct_answer = raw_response.split("ANSWER_KEY:")[1].strip()
-
-            st.info(st.session_state.current_question_text)
-            user_choice = st.radio("Select answer:", ["A", "B", "C", "D"], index=None, key=f"m2_radio_{st.session_state.count_m2}")
-            
-            if st.button("Submit Section 2 Answer"):
-                if user_choice == st.session_state.correct_answer:
-                    st.session_state.count_m2 += 1
-                    if st.session_state.count_m2 >= 2:
-                        st.balloons()
-                        st.success("🎯 Mastery achieved! Phase 3: Crisis Mgmt is now unlocked.")
-                        st.session_state.training_step = 3
-                        st.session_state.quiz_active = False
-                        del st.session_state.current_question_text
-                        # 2. Add a pause so they see the balloons and success message
-                        time.sleep(3) 
-                        # 3. Jump to next module
-                        st.switch_page(st.Page(training_module_3)) 
-                    else:
-                        st.toast("Solid form! One more.", icon="✅")
-                        del st.session_state.current_question_text
-                        st.rerun()
-                else:
-                    st.error("❌ Incorrect. Precision in the air is vital. Progress reset.")
-                    time.sleep(2)
-                    st.session_state.count_m2 = 0
-                    del st.session_state.current_question_text
-                    st.rerun()
-
-# --- PHASE 3: SURVIVAL ---
-def training_module_3():
-    if st.session_state.training_step < 3:
-        st.warning("🔒 Complete Phase 2 to unlock this module.")
-    else:
-        st.title("Phase 3: Crisis Management")
-        st.video("https://www.youtube.com/watch?v=3qDBFceGupU")
-
-        st.markdown("""
-        ### Last video on this course! 
-        Almost there!
-    
-        ### And then, your final assessment below.
-        You are just 2 correct answers away from one of the most pointless certifications you will ever get. But you do get balloons with it.
-        """)
-        
-        st.write(f"**Mastery Level:** {st.session_state.count_m3} / 2 Correct")
-        st.progress(st.session_state.count_m3 / 2)
-
-        if st.session_state.count_m3 == 0:
-            focus3 = "Focus strictly on water landings covered in SOP-CRIS-02."
-        else:
-            focus3 = "Focus strictly on cut away procedure covered in SOP-CRIS-03."
-
-        if st.button("Start Section 3 Assessment") or st.session_state.quiz_active:
-            st.session_state.quiz_active = True
-            if "current_question_text" not in st.session_state:
-                # Focus prompt on SOP-CRIS (Emergency procedures)
-                prompt = f"""
-Based ONLY on SECTION 3 of this SOP: {SOP_CONTENT}, {focus3}
-STRICT RULE: Only ONE of the four lettered options (A, B, C, or D) can be factually correct according to the SOP.
-            The other three options must be definitively WRONG based on the text, as the user will be answering with radio buttons and cannot mutiple select. 
-            Avoid "All of the above" or "None of the above" scenarios.
-            You MUST include the lettered answer options in the question.
-            Output: QUESTION: [text] ANSWER_KEY: [Letter]
-"""
-                raw_response = model.generate_content(prompt).text
-                st.session_state.current_question_text = raw_response.split("ANSWER_KEY:")[0]
-                st.session_state.correct_answer = raw_response.split("ANSWER_KEY:")[1].strip()
-
-            st.info(st.session_state.current_question_text)
-            user_choice = st.radio("Select answer:", ["A", "B", "C", "D"], index=None, key=f"m3_radio_{st.session_state.count_m3}")
-            
-            if st.button("Submit Section 3 Answer"):
-                if user_choice == st.session_state.correct_answer:
-                    st.session_state.count_m3 += 1
-                    if st.session_state.count_m3 >= 2:
-                        st.balloons()
-                        st.success("🎯 Course Complete! You are now cleared for the Live Jump Mentor.")
-                        st.session_state.training_step = 4
-                        st.session_state.quiz_active = False
-                        del st.session_state.current_question_text 
-                        # 2. Add a pause so they see the balloons and success message
-                        time.sleep(3) 
-                        # 3. Jump to grad page
-                        st.switch_page(st.Page(graduation_screen))
-                    else:
-                        st.toast("Cool under pressure! One more.", icon="✅")
-                        del st.session_state.current_question_text
-                        st.rerun()
-                else:
-                    st.error("❌ Incorrect. In a crisis, there is no room for error. Progress reset.")
-                    time.sleep(2)
-                    st.session_state.count_m3 = 0
-                    del st.session_state.current_question_text
-                    st.rerun()
+def module_page(module):
+    def page():
+        run_module(module)
+    page.__name__ = module["page"]
+    return page
+
+# Yields the mentor's answer token by token and records first-token / total latency.
+# The finally block closes the upstream stream, which also covers Streamlit abandoning
+# this run mid-answer because the user asked something new.
+def stream_answer(model, prompt, latency):
+    started = time.perf_counter()
+    # Identical questions already being answered for another trainee share that one stream
+    response = model.generate_content(prompt, stream=True, coalesce=True)
+    try:
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # Chunks without text (e.g. the final usage chunk)
+            if "first_token" not in latency:
+                latency["first_token"] = time.perf_counter() - started
+            yield text
+    finally:
+        latency["total"] = time.perf_counter() - started
+        close = getattr(response, "close", None)
+        if close:
+            close()
+
+# Degraded mode: when the model can't answer, show the SOP procedures that match the question
+def sop_excerpt_answer(user_input):
+    metrics.inc("mentor_degraded_total")
+    st.warning("The live mentor is unavailable right now, so here is what the SOP says on this topic.")
+    st.text(sop_context(user_input))
+
+# Each session keeps its own chat. Prompts stay inside MENTOR_TOKEN_BUDGET however long it runs:
+# older turns are folded into a rolling summary and each SOP procedure is sent only once.
+def mentor_conversation():
+    if "mentor" not in st.session_state:
+        st.session_state.mentor = Conversation(budget=int(st.secrets.get("MENTOR_TOKEN_BUDGET", 2000)))
+    return st.session_state.mentor
 
 def live_mentor():
     st.title("🤖 Live Jump Mentor")
     st.write("This is a live Q&A assistant for qualified SkyHigh graduates. All questions will be answered based exclusively on the SkyHigh SOP. This demo uses a system called RAG to ensure that all answers are correct and no AI hallucinations will be returned. Give it a go!")
-    # Your existing Chatbot code (from previous version) fits here!
+    conversation = mentor_conversation()
+    for turn in conversation.turns:
+        with st.chat_message("user"): st.write(turn.question)
+        with st.chat_message("assistant"):
+            if turn.answer is None:
+                st.caption("The live mentor was unavailable for this question.")
+            else:
+                st.write(turn.answer)
     user_input = st.chat_input("Ask a safety question...")
     if user_input:
         with st.chat_message("user"): st.write(user_input)
-        response = model.generate_content(f"SOP Context: {SOP_CONTENT}\nUser Question: {user_input}")
-        with st.chat_message("assistant"): st.write(response.text)
+        # An answer is only shared when its prompt has no earlier turns in it to depend on
+        standalone = conversation.standalone()
+        cached = None
+        if standalone:
+            cached = answer_cache.get(user_input, SOP_HASH)
+            metrics.inc("mentor_cache_total", result="miss" if cached is None else "hit")
+        if cached is not None:
+            with st.chat_message("assistant"): st.write(cached)
+            conversation.add(user_input, cached, [chunk.sop_id for chunk in sop_index.search(user_input)])
+            st.caption("Answered instantly from the mentor's memory")
+            return
+        model = init_vertex()
+        if model is None:
+            with st.chat_message("assistant"): sop_excerpt_answer(user_input)
+            conversation.add(user_input, None)
+            return
+        latency = {}
+        prompt, sop_ids = conversation.prompt(user_input, sop_index)
+        answer = stream_answer(model, prompt, latency)
+        with st.chat_message("assistant"):
+            try:
+                full_answer = st.write_stream(answer)
+            except Exception:  # Timed out, circuit open or Vertex errored
+                sop_excerpt_answer(user_input)
+                conversation.add(user_input, None)
+                return
+            finally:
+                answer.close()
+        if full_answer:
+            if standalone:
+                answer_cache.put(user_input, SOP_HASH, full_answer)
+            conversation.add(user_input, full_answer, sop_ids)
+        st.session_state.mentor_latency = latency
+        st.caption(f"First token {latency.get('first_token', latency['total']):.2f}s · Full answer {latency['total']:.2f}s")
 
 def graduation_screen():
     st.balloons()
@@ -434,14 +722,106 @@ def graduation_screen():
     # Show a mock certificate
     st.info("CERTIFICATE ID: SH-2025-" + str(st.session_state.count_m1 + 99))
 
+# --- Cohort analytics (admins only)
+# Answers and module completions are logged to skyhigh_events by the progress writer, and
+# Postgres triggers keep small per-stage, per-question and completion-time count tables up to
+# date (run supabase/analytics.sql once). The page reads only those, cached for every admin
+# session and re-read in the background once they are ANALYTICS_TTL_SECONDS old, so the
+# numbers cover every replica and restart. Nothing pulls the whole table.
+metrics.define("module_completion_seconds", COMPLETION_BUCKETS)
+STAGE_NAMES = {**{m["section"]: m["nav_title"] for m in MODULES}, len(MODULES) + 1: "🎓 Graduated"}
+
+# The Welcome form's email is only a claim, so it never makes anyone an admin by itself. Admins
+# sign in from the sidebar, with the app's OIDC login ([auth] in the secrets) on an ADMIN_EMAILS
+# account, or with ADMIN_TOKEN. With neither configured nobody sees the admin pages.
+ADMIN_EMAILS = st.secrets.get("ADMIN_EMAILS", [])
+ADMIN_SIGN_IN = "auth" in st.secrets or bool(st.secrets.get("ADMIN_TOKEN"))
+
+def is_admin():
+    if st.session_state.get("admin"):
+        return True
+    return "auth" in st.secrets and st.user.is_logged_in and st.user.get("email") in ADMIN_EMAILS
+
+def admin_sign_in():
+    with st.expander("🔑 Admin sign-in"):
+        if "auth" in st.secrets:
+            st.button("Sign in with SSO", on_click=st.login)
+        token = st.secrets.get("ADMIN_TOKEN")
+        if token:
+            entered = st.text_input("Admin token", type="password")
+            if entered and hmac.compare_digest(entered.encode(), str(token).encode()):
+                st.session_state.admin = True
+                st.rerun()
+            elif entered:
+                st.error("That token is not valid.")
+
+@st.cache_resource(show_spinner=False)
+def get_cohort_stats():
+    return CohortStats(progress_store.client, ttl=float(st.secrets.get("ANALYTICS_TTL_SECONDS", 60)))
+
+def cohort_dashboard():
+    st.title("📊 Cohort Analytics")
+    if not is_admin():
+        st.warning("🔒 This page is for SkyHigh admins.")
+        return
+    stats = get_cohort_stats()
+    cohort, refreshed_at = stats.snapshot()
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        if refreshed_at is None:
+            st.info("Loading cohort numbers… refresh the page in a moment.")
+        else:
+            st.caption(f"Cohort numbers as of {time.strftime('%H:%M:%S', time.localtime(refreshed_at))}")
+    with col2:
+        if st.button("🔄 Refresh"):
+            stats.refresh()
+
+    st.subheader("Where trainees are")
+    st.bar_chart(
+        {"stage": list(STAGE_NAMES.values()), "trainees": [cohort.stages.get(step, 0) for step in STAGE_NAMES]},
+        x="stage", y="trainees",
+    )
+    st.subheader("Funnel")
+    st.dataframe(funnel(cohort.stages, STAGE_NAMES), hide_index=True)
+
+    st.subheader("Answers per question")
+    st.dataframe(answer_rows(cohort.answers, STAGE_NAMES), hide_index=True)
+
+    st.subheader("Time to pass a module")
+    st.dataframe(completion_rows(cohort.completions, STAGE_NAMES), hide_index=True)
+
+    st.subheader("Trainees at a stage")
+    step = st.selectbox("Stage", list(STAGE_NAMES), format_func=STAGE_NAMES.get)
+    # Keyset pagination: the cursor stack holds the last email of each page already seen
+    cursors = st.session_state.setdefault("roster_cursors", {}).setdefault(step, [None])
+    try:
+        rows = stats.page(step, after=cursors[-1])
+    except Exception as e:
+        st.warning(f"The trainee list is unavailable right now: {e}")
+        return
+    st.dataframe(rows, hide_index=True)
+    col1, col2, _ = st.columns([1, 1, 4])
+    if col1.button("⬅️ Previous", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if col2.button("Next ➡️", disabled=len(rows) < stats.page_size):
+        cursors.append(rows[-1]["email"])
+        st.rerun()
+
 # --- 4. SIDEBAR NAVIGATION ---
 # 1. Define all page objects once
 welcome_p = st.Page(welcome_home, title="Welcome", icon="🏠")
-m1_p = st.Page(training_module_1, title="1. Pre-Flight", icon="🛠️")
-m2_p = st.Page(training_module_2, title="2. The Jump", icon="🍌")
-m3_p = st.Page(training_module_3, title="3. Crisis Mgmt", icon="🚨")
+module_pages = [st.Page(module_page(m), title=m["nav_title"], icon=m["icon"]) for m in MODULES]
 grad_p = st.Page(graduation_screen, title="Graduation", icon="🎓")
 mentor_p = st.Page(live_mentor, title="Live Jump Mentor", icon="🛩️")
+analytics_p = st.Page(cohort_dashboard, title="Cohort Analytics", icon="📊")
+
+def page_for_step(step):
+    if step < 1:
+        raise ValueError(f"No training step {step}; steps start at 1")
+    if not assessed:
+        return mentor_p
+    return module_pages[step - 1] if step <= len(module_pages) else grad_p
 
 # 2. Safely check for progress
 current_s = st.session_state.get("training_step", 1)
@@ -449,13 +829,16 @@ current_s = st.session_state.get("training_step", 1)
 # 3. Build the pages dictionary
 pages = {
     "Start Here": [welcome_p],
-    "Training Hangar": [m1_p, m2_p, m3_p]
+    "Training Hangar": list(module_pages)
 }
 
 # 4. Add Conditional Pages if step is high enough
-if current_s > 3:
+if current_s > len(MODULES):
     pages["Training Hangar"].append(grad_p)
+if current_s > len(MODULES) or not assessed:
     pages["Operations"] = [mentor_p]
+if is_admin():
+    pages["Admin"] = [analytics_p]
 
 # 5. Simple Navigation - No 'default_page' jump logic for now
 pg = st.navigation(pages, position="sidebar")
@@ -464,19 +847,48 @@ pg = st.navigation(pages, position="sidebar")
 with st.sidebar:
     st.image("TECHDEMO.png", width='stretch')
     st.markdown("---")
-    st.write(f"**Current Progress:** Stage {current_s} of 4")
+    st.write(f"**Current Progress:** Stage {current_s} of {len(MODULES) + 1}")
+    if manual.name != DEFAULT_MANUAL:
+        st.caption(f"Manual: {manual.name}")
     
     if st.button("Reset Tech Demo"):
         # Reset markers
         st.session_state.training_step = 1
-        st.session_state.count_m1 = 0
-        st.session_state.count_m2 = 0
-        st.session_state.count_m3 = 0
+        for module in MODULES:
+            st.session_state[f"count_m{module['section']}"] = 0
+            st.session_state.pop(f"started_m{module['section']}", None)
+        discard_prefetched()
         # Clear identity
-        for key in ["user_email", "user_name", "current_question_text", "correct_answer"]:
+        for key in ["user_email", "user_name", "current_question", "correct_answer", "mentor", "admin",
+                    "roster_cursors"]:
             if key in st.session_state:
                 del st.session_state[key]
         st.rerun()
 
+    # Only offered to the addresses admins log in with; signing in is what grants access
+    if ADMIN_SIGN_IN and not is_admin() and st.session_state.get("user_email") in ADMIN_EMAILS:
+        admin_sign_in()
+
+    # Admin-only view of the live numbers
+    if metrics.enabled and is_admin():
+        with st.expander("📈 Performance Metrics"):
+            st.dataframe(metrics.summary(), hide_index=True)
+            st.json(metrics.counters())
+            st.caption("Start-up costs (first run of each step)")
+            st.dataframe(startup.rows(), hide_index=True)
+
 # 6. Render the app
-pg.run()
\ No newline at end of file
+show_flash()
+try:
+    with metrics.span("page_render", page=pg.title):
+        pg.run()
+finally:
+    metrics.observe("rerun_seconds", time.perf_counter() - _rerun_started)
+    startup.mark("first paint")
+    # With the first page out, get the model, question pool and database ready before anyone logs in
+    warm_up = [("model backend", get_vertex_client)]
+    if assessed:
+        warm_up.append(("question pool", lambda: get_question_pool(
+            get_vertex_client(), QUESTION_PROMPTS, QUESTION_SOPS, FALLBACK_QUESTIONS)))
+    warm_up.append(("supabase connect", progress_store.client))
+    startup.warm_up(*warm_up)
\ No newline at end of file
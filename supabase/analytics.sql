@@ -0,0 +1,92 @@
+-- Cohort analytics for the admin dashboard (skyhigh/analytics.py).
+-- Run once in the Supabase SQL editor; it is safe to run again.
+--
+-- The app appends every assessment answer and module completion to skyhigh_events. Triggers
+-- fold each new row of skyhigh_events and skyhigh_users into the small *_counts tables, so
+-- the dashboard reads a few dozen rows however many trainees there are.
+
+create table if not exists skyhigh_events (
+    id bigint generated always as identity primary key,
+    created_at timestamptz not null default now(),
+    email text not null,
+    section int not null,
+    question int,              -- null for a completion
+    result text not null,      -- 'correct', 'reset' or 'completed'
+    seconds double precision,  -- time taken to pass the module, for 'completed'
+    bucket int                 -- index into COMPLETION_BUCKETS, for 'completed'
+);
+
+create table if not exists skyhigh_stage_counts (
+    training_step int primary key,
+    trainees bigint not null default 0
+);
+
+create table if not exists skyhigh_answer_counts (
+    section int not null,
+    question int not null,
+    result text not null,
+    answers bigint not null default 0,
+    primary key (section, question, result)
+);
+
+create table if not exists skyhigh_completion_counts (
+    section int not null,
+    bucket int not null,
+    completions bigint not null default 0,
+    seconds_sum double precision not null default 0,
+    primary key (section, bucket)
+);
+
+create index if not exists skyhigh_users_step_email on skyhigh_users (training_step, email);
+
+-- Trainees per training step
+create or replace function skyhigh_count_stage() returns trigger language plpgsql as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') and old.training_step is not null then
+        update skyhigh_stage_counts set trainees = trainees - 1 where training_step = old.training_step;
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') and new.training_step is not null then
+        insert into skyhigh_stage_counts (training_step, trainees) values (new.training_step, 1)
+        on conflict (training_step) do update set trainees = skyhigh_stage_counts.trainees + 1;
+    end if;
+    return null;
+end $$;
+
+create or replace trigger skyhigh_users_stage_added
+after insert or delete on skyhigh_users
+for each row execute function skyhigh_count_stage();
+
+create or replace trigger skyhigh_users_stage_moved
+after update of training_step on skyhigh_users
+for each row when (old.training_step is distinct from new.training_step)
+execute function skyhigh_count_stage();
+
+-- Answers per question and completion-time buckets per module
+create or replace function skyhigh_count_event() returns trigger language plpgsql as $$
+begin
+    if new.result = 'completed' then
+        insert into skyhigh_completion_counts (section, bucket, completions, seconds_sum)
+        values (new.section, new.bucket, 1, new.seconds)
+        on conflict (section, bucket) do update set
+            completions = skyhigh_completion_counts.completions + 1,
+            seconds_sum = skyhigh_completion_counts.seconds_sum + excluded.seconds_sum;
+    else
+        insert into skyhigh_answer_counts (section, question, result, answers)
+        values (new.section, new.question, new.result, 1)
+        on conflict (section, question, result) do update set answers = skyhigh_answer_counts.answers + 1;
+    end if;
+    return null;
+end $$;
+
+create or replace trigger skyhigh_events_counts
+after insert on skyhigh_events
+for each row execute function skyhigh_count_event();
+
+-- Start the stage counts from the trainees already there. The lock holds off writes (which
+-- would also fire the triggers) until the counts are in.
+begin;
+lock table skyhigh_users in share row exclusive mode;
+delete from skyhigh_stage_counts;
+insert into skyhigh_stage_counts (training_step, trainees)
+select training_step, count(*) from skyhigh_users where training_step is not null group by training_step;
+commit;
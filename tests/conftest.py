@@ -0,0 +1,106 @@
+"""An in-memory stand-in for the Supabase client, shared by the database-facing tests."""
+from types import SimpleNamespace
+
+import pytest
+
+from skyhigh.progress import ProgressStore
+
+
+class FakeQuery:
+    """One ``client.table(name)`` call: builder methods chain, ``execute`` runs it."""
+
+    def __init__(self, db, name):
+        self.db, self.name = db, name
+        self.write = None
+        self.filters = []
+        self.order_by = None
+        self.row_limit = None
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] > value)
+        return self
+
+    def in_(self, column, values):
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column):
+        self.order_by = column
+        return self
+
+    def limit(self, n):
+        self.row_limit = n
+        return self
+
+    def upsert(self, rows, on_conflict=None):
+        self.write = ("upsert", rows if isinstance(rows, list) else [rows], on_conflict)
+        return self
+
+    def insert(self, rows):
+        self.write = ("insert", rows, None)
+        return self
+
+    def execute(self):
+        if self.name in self.db.missing:
+            raise RuntimeError(f"relation {self.name} does not exist")
+        self.db.queries.append(self.name)
+        table = self.db.tables.setdefault(self.name, [])
+        if self.write is None:
+            rows = [row for row in table if all(match(row) for match in self.filters)]
+            if self.order_by:
+                rows.sort(key=lambda row: row[self.order_by])
+            return SimpleNamespace(data=[dict(row) for row in rows[:self.row_limit]])
+        op, rows, key = self.write
+        getattr(self.db, op + "s").extend(rows)
+        stored = [self.db.put(self.name, row, key) for row in rows]
+        return SimpleNamespace(data=[dict(row) for row in stored])
+
+
+class FakeSupabase:
+    """Tables are lists of row dicts; ``defaults`` fills columns a new row is written without."""
+
+    def __init__(self):
+        self.tables = {}
+        self.defaults = {}
+        self.missing = set()  # Tables whose queries fail, as if they were never created
+        self.queries = []  # Table name of every executed query
+        self.upserts, self.inserts = [], []
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def put(self, name, row, key=None):
+        table = self.tables.setdefault(name, [])
+        for stored in table:
+            if key is not None and stored.get(key) == row[key]:
+                stored.update(row)
+                return stored
+        table.append({**self.defaults.get(name, {}), **row})
+        return table[-1]
+
+    def row(self, name, **match):
+        """The one row of table ``name`` with these column values."""
+        [row] = [row for row in self.tables.get(name, []) if all(row.get(k) == v for k, v in match.items())]
+        return row
+
+
+@pytest.fixture
+def supabase():
+    return FakeSupabase()
+
+
+@pytest.fixture
+def store(supabase):
+    """Makes a ``ProgressStore`` on ``supabase`` whose writer thread is stopped; tests call flush()."""
+    def make(**kwargs):
+        progress = ProgressStore(lambda: supabase, flush_interval=3600, **kwargs)
+        progress.close()
+        return progress
+    return make
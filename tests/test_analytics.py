@@ -0,0 +1,83 @@
+"""Cohort analytics: events written by the progress store and the dashboard's rows."""
+from skyhigh.analytics import (
+    CohortStats, answer_event, answer_rows, completion_event, completion_rows, funnel, _completions,
+)
+
+NAMES = {1: "Pre-Flight", 2: "The Jump", 3: "Graduated"}
+
+
+def test_events_are_inserted_with_the_progress_rows(supabase, store):
+    progress = store()
+    progress.save("Ann", "a@x", 2)
+    progress.record(answer_event("a@x", 1, 2, True))
+    progress.record(completion_event("a@x", 1, 400))
+    progress.flush()
+    assert [row["training_step"] for row in supabase.upserts] == [2]
+    assert [event["result"] for event in supabase.inserts] == ["correct", "completed"]
+    assert answer_event("a@x", 1, 1, False).keys() == completion_event("a@x", 1, 1).keys()
+
+
+def test_failed_events_never_hold_back_progress(supabase, store):
+    supabase.missing.add("skyhigh_events")
+    progress = store(max_events=2)
+    progress.save("Ann", "a@x", 3)
+    for question in (1, 2, 3):
+        progress.record(answer_event("a@x", 1, question, True))
+    progress.flush()
+    assert [row["training_step"] for row in supabase.upserts] == [3]
+    assert not progress._breaker.is_open
+    assert [event["question"] for event in progress._events] == [2, 3]  # Oldest dropped, rest kept to retry
+    supabase.missing.clear()
+    progress.flush()
+    assert [event["question"] for event in supabase.inserts] == [2, 3]
+
+
+def test_snapshot_reads_the_count_tables(supabase):
+    supabase.tables.update({
+        "skyhigh_stage_counts": [{"training_step": 1, "trainees": 3}, {"training_step": 3, "trainees": 1}],
+        "skyhigh_answer_counts": [
+            {"section": 1, "question": 1, "result": "correct", "answers": 3},
+            {"section": 1, "question": 1, "result": "reset", "answers": 1},
+        ],
+        "skyhigh_completion_counts": [{"section": 1, "bucket": 3, "completions": 2, "seconds_sum": 500.0}],
+    })
+    stats = CohortStats(lambda: supabase)
+    stats._reload()
+    cohort, refreshed_at = stats.snapshot()
+    assert refreshed_at is not None
+    assert funnel(cohort.stages, NAMES)[0] == {"stage": "Pre-Flight", "at this stage": 3, "reached": 4, "drop-off": "75%"}
+    assert answer_rows(cohort.answers, NAMES) == [
+        {"module": "Pre-Flight", "question": 1, "correct": 3, "reset": 1, "pass rate": "75%"},
+    ]
+    [row] = completion_rows(cohort.completions, NAMES)
+    assert row["passes"] == 2 and row["mean min"] == round(250 / 60, 1)
+
+
+def test_completion_buckets_add_up():
+    events = [completion_event("a@x", 1, seconds) for seconds in (20, 45, 45, 100_000)]
+    rows = {}
+    for e in events:
+        row = rows.setdefault(e["bucket"], {"section": 1, "bucket": e["bucket"], "completions": 0, "seconds_sum": 0})
+        row["completions"] += 1
+        row["seconds_sum"] += e["seconds"]
+    histogram = _completions(rows.values())[1]
+    assert histogram.counts[0] == 1 and histogram.counts[1] == 2 and histogram.counts[-1] == 1
+    assert histogram.quantile(0.5) == 45  # Interpolated inside the 30-60s bucket
+
+
+def test_roster_pages_are_cached_until_refresh(supabase):
+    for n in range(3):
+        supabase.put("skyhigh_users", {"full_name": f"T{n}", "email": f"t{n}@x", "training_step": 2})
+    stats = CohortStats(lambda: supabase, page_size=2)
+    first = stats.page(2)
+    assert [row["email"] for row in first] == ["t0@x", "t1@x"]
+    assert [row["email"] for row in stats.page(2, after="t1@x")] == ["t2@x"]
+    assert stats.page(2) == first
+    assert supabase.queries.count("skyhigh_users") == 2
+    supabase.missing.add("skyhigh_users")
+    stats._pages[(2, None)] = (first, 0)  # Gone stale
+    assert stats.page(2) == first  # Served while the database is unreachable
+    supabase.missing.clear()
+    stats.refresh()
+    stats.page(2)
+    assert supabase.queries.count("skyhigh_users") == 3
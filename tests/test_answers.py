@@ -0,0 +1,49 @@
+"""The mentor answer cache must never hand one question's answer to a different question."""
+from skyhigh.answers import AnswerCache, normalise
+
+SOP = "sop-v1"
+
+
+def cached(question, answer="Yes."):
+    cache = AnswerCache()
+    cache.put(question, SOP, answer)
+    return cache
+
+
+def test_wording_case_and_punctuation_do_not_matter():
+    cache = cached("What altitude do I deploy at?")
+    assert cache.get("what altitude do i deploy at", SOP) == "Yes."
+    assert cache.get("  What   altitude do I deploy at ?! ", SOP) == "Yes."
+    assert normalise("Deploy at 3,000ft.") == "deploy at 3000ft"
+
+
+def test_filler_words_are_a_near_hit():
+    cache = cached("What is the deployment altitude?")
+    assert cache.get("Hi, what is deployment altitude please?", SOP) == "Yes."
+    assert cache.stats()["near_hits"] == 1
+
+
+def test_question_words_and_negations_are_different_questions():
+    cache = cached("When do I pull the reserve handle?")
+    assert cache.get("How do I pull the reserve handle?", SOP) is None
+    assert cache.get("Why should I pull the reserve handle?", SOP) is None
+    cache = cached("Can I unclip the leg straps before my feet touch the water?")
+    assert cache.get("Why can I not unclip the leg straps before my feet touch the water?", SOP) is None
+    assert cache.get("Can't I unclip the leg straps before my feet touch the water?", SOP) is None
+
+
+def test_word_order_matters():
+    cache = cached("Should I cut away before I deploy the reserve?")
+    assert cache.get("Should I deploy the reserve before I cut away?", SOP) is None
+
+
+def test_eviction_forgets_the_near_key():
+    cache = AnswerCache(max_entries=1)
+    cache.put("What is the deployment altitude?", SOP, "3,000ft")
+    cache.put("When do I flare?", SOP, "At 10ft")
+    assert cache.get("What is deployment altitude?", SOP) is None
+
+
+def test_a_new_sop_version_empties_the_cache():
+    cache = cached("When do I flare?")
+    assert cache.get("When do I flare?", "sop-v2") is None
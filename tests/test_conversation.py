@@ -0,0 +1,85 @@
+"""Mentor chat memory: every prompt fits its token budget however long the chat runs."""
+from skyhigh.conversation import Conversation, estimate_tokens
+from skyhigh.retrieval import SopIndex
+
+SOP = """
+SECTION 1: EQUIPMENT
+SOP-GEAR-01: The Main Ripcord deploys the primary chute. The Reserve Handle is used only after a Cut-away.
+SOP-GEAR-02: Check the altimeter every 5 seconds. Deploy by 3,000ft.
+SECTION 2: SKILLS
+SOP-NAV-01: Flare by pulling both toggles down at 10ft above ground.
+SECTION 3: CRISIS
+SOP-CRIS-01: Clear line twists with a bicycle kick. If not cleared by 2,500ft, cut away.
+SOP-CRIS-02: In a water landing unclip the chest strap in the air and the leg straps when your feet touch the water.
+"""
+
+QUESTIONS = [
+    "What altitude do I deploy at?",
+    "How do I flare before landing?",
+    "What do I do about line twists?",
+    "When do I unclip the leg straps in a water landing?",
+    "When may I use the reserve handle?",
+]
+
+index = SopIndex.from_text(SOP)
+
+
+def answer(n):
+    return f"Answer {n}: stay calm and follow the procedure. " + "Keep checking your altitude. " * 8
+
+
+def chat(conversation, turns):
+    """Ask ``turns`` questions, checking every prompt on the way; returns the last prompt."""
+    for n in range(turns):
+        question = QUESTIONS[n % len(QUESTIONS)]
+        prompt, sop_ids = conversation.prompt(question, index)
+        assert estimate_tokens(prompt) <= conversation.budget
+        for sop_id in index.by_id:
+            assert prompt.count(f"{sop_id}:") <= 1
+        conversation.add(question, answer(n), sop_ids)
+    return prompt
+
+
+def test_an_opening_question_stands_alone():
+    conversation = Conversation()
+    assert conversation.standalone()
+    prompt, sop_ids = conversation.prompt("What altitude do I deploy at?", index)
+    assert prompt.startswith("SOP Context: ")
+    assert prompt.endswith("User Question: What altitude do I deploy at?")
+    assert "SOP-GEAR-02" in sop_ids
+
+
+def test_unanswered_turns_leave_the_next_prompt_standalone():
+    conversation = Conversation()
+    conversation.add("What altitude do I deploy at?", None)
+    assert conversation.standalone()
+    conversation.add("How do I flare before landing?", answer(1), ["SOP-NAV-01"])
+    assert not conversation.standalone()
+
+
+def test_a_long_chat_stays_within_budget():
+    conversation = Conversation(budget=500, summary_budget=80)
+    prompt = chat(conversation, 40)
+    assert conversation.summary
+    assert "Earlier in this conversation:" in prompt
+    assert "Recent conversation:" in prompt
+    assert sum(estimate_tokens(line) for line in conversation.summary) <= conversation.summary_budget
+
+
+def test_procedures_from_earlier_turns_are_added_once():
+    conversation = Conversation(budget=2000)
+    conversation.add("What do I do about line twists?", answer(0), ["SOP-CRIS-01", "SOP-GEAR-02"])
+    conversation.add("And after that?", answer(1), ["SOP-CRIS-01"])
+    prompt, _ = conversation.prompt("What altitude do I deploy at?", index)
+    assert prompt.count("SOP-CRIS-01:") == 1
+    assert prompt.count("SOP-GEAR-02:") == 1
+
+
+def test_turns_past_max_turns_are_dropped_into_the_summary():
+    conversation = Conversation(budget=500, summary_budget=80, max_turns=5)
+    chat(conversation, 12)
+    assert [turn.answer for turn in conversation.turns] == [answer(n) for n in range(7, 12)]
+    assert 0 <= conversation.compacted <= len(conversation.turns)
+    assert conversation.summary[-1].startswith("- Asked:")
+    assert sum(estimate_tokens(line) for line in conversation.summary) <= conversation.summary_budget
+    chat(conversation, 3)  # Still consistent after the drop
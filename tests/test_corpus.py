@@ -0,0 +1,91 @@
+"""SOP manuals on disk: loaded lazily, re-read only when their file changes."""
+import mmap
+import os
+
+import pytest
+
+from skyhigh import corpus as corpus_module
+from skyhigh.corpus import Corpus
+
+SOP = "SECTION 1: EQUIPMENT\nSOP-GEAR-02: Deploy by {altitude}ft.\n"
+
+
+def write(root, name, altitude=3000, mtime_ns=None):
+    path = root / f"{name}_sop.txt"
+    path.write_text(SOP.format(altitude=altitude))
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return path
+
+
+def test_manuals_are_found_by_suffix(tmp_path):
+    write(tmp_path, "acme")
+    write(tmp_path, "skyhigh")
+    (tmp_path / "notes.txt").write_text("not a manual")
+    assert Corpus(str(tmp_path)).names() == ["acme", "skyhigh"]
+
+
+def test_an_unchanged_file_is_not_read_again(tmp_path, monkeypatch):
+    write(tmp_path, "acme")
+    corpus = Corpus(str(tmp_path))
+    first = corpus.get("acme")
+    monkeypatch.setattr(corpus, "_load", lambda name, size: pytest.fail("re-read an unchanged file"))
+    assert corpus.get("acme") == first
+
+
+def test_a_changed_file_is_reloaded(tmp_path):
+    write(tmp_path, "acme", 3000, mtime_ns=10**18)
+    corpus = Corpus(str(tmp_path))
+    before = corpus.get("acme")
+    write(tmp_path, "acme", 4000, mtime_ns=10**18 + 10**9)  # Same size, new mtime
+    after = corpus.get("acme")
+    assert after.sop_hash != before.sop_hash
+    assert "4000ft" in after.index.by_id["SOP-GEAR-02"].text
+
+
+def test_a_touched_file_keeps_its_parsed_index(tmp_path):
+    write(tmp_path, "acme", mtime_ns=10**18)
+    corpus = Corpus(str(tmp_path))
+    before = corpus.get("acme")
+    write(tmp_path, "acme", mtime_ns=10**18 + 10**9)
+    after = corpus.get("acme")
+    assert after.sop_hash == before.sop_hash
+    assert after.index is before.index
+
+
+@pytest.mark.parametrize("threshold, mapped", [(1 << 20, False), (0, True)])
+def test_large_files_are_memory_mapped(tmp_path, monkeypatch, threshold, mapped):
+    write(tmp_path, "acme")
+    maps, real_mmap = [], mmap.mmap
+
+    def spy(*args, **kwargs):
+        maps.append(args)
+        return real_mmap(*args, **kwargs)
+
+    monkeypatch.setattr(corpus_module.mmap, "mmap", spy)
+    manual = Corpus(str(tmp_path), mmap_threshold=threshold).get("acme")
+    assert bool(maps) == mapped
+    assert "SOP-GEAR-02" in manual.index.by_id
+
+
+def test_least_recently_used_manuals_are_evicted(tmp_path):
+    for n, name in enumerate(("a", "b", "c")):
+        write(tmp_path, name, altitude=1000 * (n + 1))
+    corpus = Corpus(str(tmp_path), max_loaded=2)
+    a = corpus.get("a")
+    b = corpus.get("b")
+    assert corpus.get("a").index is a.index  # Now most recently used
+    corpus.get("c")
+    assert corpus.get("a").index is a.index
+    assert corpus.get("b").index is not b.index  # Evicted, so parsed again
+
+
+@pytest.mark.parametrize("name", [os.path.join("..", "acme"), os.path.join("sub", "acme")])
+def test_names_with_a_path_separator_are_refused(tmp_path, name):
+    (tmp_path / "sub").mkdir()
+    write(tmp_path, "acme")
+    write(tmp_path / "sub", "acme")  # Both names would reach a real file if they were let through
+    with pytest.raises(FileNotFoundError):
+        Corpus(str(tmp_path / "sub")).get(name)
+    with pytest.raises(FileNotFoundError):
+        Corpus(str(tmp_path)).get(name)
@@ -0,0 +1,154 @@
+"""The model call stack the app builds: limiter outermost, deadline and breaker in its slot."""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from skyhigh.limiter import ModelLimiter
+from skyhigh.metrics import InstrumentedModel, metrics
+from skyhigh.resilience import CircuitBreaker, CircuitOpenError, GuardedModel
+
+
+class Throttled(Exception):
+    code = 429
+
+
+class FakeBackend:
+    def __init__(self, latency=0.0, errors=()):
+        self.latency = latency
+        self.errors = list(errors)
+        self.calls = []
+        self.running = self.peak = 0
+        self.gate = threading.Event()
+        self.gate.set()
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.gate.wait()
+        with self._lock:
+            self.calls.append(prompt)
+            error = self.errors.pop(0) if self.errors else None
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(self.latency)
+        with self._lock:
+            self.running -= 1
+        if error is not None:
+            raise error
+        return SimpleNamespace(text=prompt, usage_metadata=None)
+
+
+def stack(backend, session, max_concurrent=4, timeout=5.0, failure_threshold=5, first_token_timeout=1.0):
+    """Built the same way as ``get_vertex_client`` in the app."""
+    guarded = GuardedModel(backend, CircuitBreaker("model", failure_threshold), timeout=timeout,
+                           first_token_timeout=first_token_timeout)
+    limiter = ModelLimiter(guarded, session_id=session, max_concurrent=max_concurrent, rate=1000, burst=1000,
+                           backoff=0.01, first_token_timeout=first_token_timeout)
+    return InstrumentedModel(limiter, metrics), guarded.breaker, limiter
+
+
+def call_as(model, session, local, prompt, results):
+    def run():
+        local.session = session
+        try:
+            results[prompt] = model.generate_content(prompt).text
+        except Exception as e:
+            results[prompt] = e
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def wait_queued(limiter, n):
+    deadline = time.monotonic() + 5
+    while sum(len(q) for q in limiter._queues.values()) < n:
+        assert time.monotonic() < deadline, "calls never queued"
+        time.sleep(0.005)
+
+
+def test_sessions_are_granted_round_robin():
+    local = threading.local()
+    backend = FakeBackend()
+    model, _, limiter = stack(backend, lambda: getattr(local, "session", None), max_concurrent=1)
+    results = {}
+    backend.gate.clear()
+    threads = [call_as(model, "blocker", local, "blocker", results)]
+    wait_queued(limiter, 0)
+    time.sleep(0.05)  # The blocker holds the only slot
+    for prompt in ("a1", "a2", "a3"):
+        threads.append(call_as(model, "session-A", local, prompt, results))
+        wait_queued(limiter, len(threads) - 1)
+    threads.append(call_as(model, "session-B", local, "b1", results))
+    wait_queued(limiter, 4)
+    backend.gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert backend.calls == ["blocker", "a1", "b1", "a2", "a3"]
+
+
+def test_queueing_does_not_count_against_the_deadline():
+    backend = FakeBackend(latency=0.1)
+    model, breaker, _ = stack(backend, lambda: None, max_concurrent=2, timeout=0.3, failure_threshold=3)
+    results = {}
+    threads = [call_as(model, f"s{i}", threading.local(), f"q{i}", results) for i in range(12)]
+    for thread in threads:
+        thread.join(5)
+    assert results == {f"q{i}": f"q{i}" for i in range(12)}
+    assert not breaker.is_open
+
+
+def test_breaker_opens_and_fails_fast():
+    backend = FakeBackend(errors=[RuntimeError("boom")] * 3)
+    model, breaker, _ = stack(backend, lambda: None, failure_threshold=3)
+    for _ in range(3):
+        with pytest.raises(RuntimeError, match="boom"):
+            model.generate_content("q")
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        model.generate_content("q")
+    assert len(backend.calls) == 3
+
+
+def test_slow_call_times_out_and_counts_as_a_failure():
+    backend = FakeBackend(latency=0.5)
+    model, breaker, _ = stack(backend, lambda: None, timeout=0.1, failure_threshold=1)
+    with pytest.raises(TimeoutError):
+        model.generate_content("q")
+    assert breaker.is_open
+
+
+def test_timed_out_calls_keep_their_slot_until_the_backend_finishes():
+    backend = FakeBackend(latency=0.2)
+    model, _, _ = stack(backend, lambda: None, max_concurrent=2, timeout=0.05, failure_threshold=100)
+    results = {}
+    threads = [call_as(model, f"s{i}", threading.local(), f"q{i}", results) for i in range(10)]
+    for thread in threads:
+        thread.join(5)
+    assert all(isinstance(result, TimeoutError) for result in results.values())
+    assert len(backend.calls) == 10
+    assert backend.peak == 2
+
+
+@pytest.mark.parametrize("coalesce", [False, True])
+def test_a_stream_gives_up_waiting_for_a_slot(coalesce):
+    backend = FakeBackend(latency=0.5)
+    model, breaker, _ = stack(backend, lambda: None, max_concurrent=1, first_token_timeout=0.1)
+    results = {}
+    blocker = call_as(model, "blocker", threading.local(), "blocker", results)
+    time.sleep(0.05)
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        list(model.generate_content("q", stream=True, coalesce=coalesce))
+    assert time.monotonic() - started < 0.4
+    blocker.join(5)
+    assert results == {"blocker": "blocker"}
+    assert not breaker.is_open
+
+
+def test_quota_pushback_is_retried_without_opening_the_breaker():
+    backend = FakeBackend(errors=[Throttled("quota")] * 3)
+    model, breaker, _ = stack(backend, lambda: None, failure_threshold=2)
+    assert model.generate_content("q").text == "q"
+    assert len(backend.calls) == 4
+    assert not breaker.is_open
@@ -0,0 +1,35 @@
+"""Trainee progress: resuming, and the write-behind queue."""
+import pytest
+
+USERS = "skyhigh_users"
+
+
+def trainee(supabase, step):
+    supabase.put(USERS, {"full_name": "Ann", "email": "a@x", "training_step": step})
+
+
+@pytest.mark.parametrize("default", [None, 0])
+def test_a_new_trainee_starts_at_step_one(supabase, store, default):
+    supabase.defaults[USERS] = {"training_step": default}  # What the database fills in for a new row
+    progress = store()
+    assert progress.resume("Ann", "a@x") == 1
+    progress.flush()
+    assert supabase.row(USERS, email="a@x")["training_step"] == 1
+
+
+def test_a_returning_trainee_keeps_their_step(supabase, store):
+    trainee(supabase, 3)
+    progress = store()
+    assert progress.resume("Ann", "a@x") == 3
+    progress.flush()
+    assert supabase.row(USERS, email="a@x")["training_step"] == 3
+
+
+def test_resuming_from_the_cache_does_not_write_a_stale_step(supabase, store):
+    trainee(supabase, 2)
+    progress = store()
+    assert progress.resume("Ann", "a@x") == 2
+    supabase.row(USERS, email="a@x")["training_step"] = 4  # Another replica moves them on
+    progress.resume("Ann", "a@x")
+    progress.flush()
+    assert supabase.row(USERS, email="a@x")["training_step"] == 4
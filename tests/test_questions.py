@@ -0,0 +1,119 @@
+"""Question generation: validation, the per-focus SOP check and the latency budget."""
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from skyhigh.backends import ReplayModel
+from skyhigh.limiter import ModelLimiter
+from skyhigh.questions import InvalidQuestion, QuestionPool, parse_question
+from skyhigh.resilience import CircuitBreaker, GuardedModel
+
+OPTIONS = {"A": "10ft", "B": "50ft", "C": "100ft", "D": "1,000ft"}
+
+
+def reply(answer="A", sop_id="SOP-NAV-01", options=OPTIONS):
+    return json.dumps({"stem": "At what height is the Flare performed?", "options": options,
+                       "answer": answer, "sop_id": sop_id})
+
+
+class FakeModel:
+    def __init__(self, text, latency=0.0):
+        self.text = text
+        self.latency = latency
+        self.calls = []
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls.append(kwargs)
+        time.sleep(self.latency)
+        return SimpleNamespace(text=self.text)
+
+
+def pool(model, **kwargs):
+    # Nothing is stocked in the background, so every take() generates inline
+    return QuestionPool(model, {(2, 1): "prompt"}, target=0, low_water=0, **kwargs)
+
+
+def test_answers_are_normalised_to_a_letter():
+    for answer in ("A", "a.", "**A**", "A) 10ft"):
+        assert parse_question(reply(answer)).answer == "A"
+    assert parse_question("```json\n" + reply() + "\n```").options == tuple(OPTIONS.values())
+
+
+@pytest.mark.parametrize("text, reason", [
+    ("QUESTION: x? ANSWER_KEY: A", "json"),
+    (reply(answer="E"), "answer"),
+    (reply(options={**OPTIONS, "D": "All of the above"}), "options"),
+    (reply(options={**OPTIONS, "D": "10ft"}), "options"),
+    (reply(options={"A": "10ft", "B": "50ft", "C": "100ft"}), "options"),
+])
+def test_unusable_questions_are_rejected(text, reason):
+    with pytest.raises(InvalidQuestion) as raised:
+        parse_question(text)
+    assert raised.value.reason == reason
+
+
+def test_question_must_cite_its_focus_procedure():
+    model = FakeModel(reply(sop_id="SOP-GEAR-01"))
+    with pytest.raises(InvalidQuestion, match="SOP-GEAR-01"):
+        pool(model, sop_ids={(2, 1): {"SOP-NAV-01"}}).generate((2, 1))
+    assert len(model.calls) == 3  # max_attempts
+    model.text = reply(sop_id="SOP-NAV-01")
+    assert pool(model, sop_ids={(2, 1): {"SOP-NAV-01"}}).generate((2, 1)).sop_id == "SOP-NAV-01"
+
+
+def test_no_attempt_starts_once_the_budget_is_spent():
+    model = FakeModel("not json", latency=0.2)
+    started = time.monotonic()
+    with pytest.raises(InvalidQuestion):
+        pool(model, max_attempts=10, time_budget=0.3).generate((2, 1))
+    assert len(model.calls) == 2
+    assert time.monotonic() - started < 0.5
+    assert model.calls[0]["deadline"] == model.calls[1]["deadline"]
+
+
+def test_each_call_gets_what_is_left_of_the_budget():
+    breaker = CircuitBreaker("model", failure_threshold=1)
+    model = ModelLimiter(GuardedModel(FakeModel(reply(), latency=1.0), breaker, timeout=30), max_concurrent=1)
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        pool(model, time_budget=0.2).generate((2, 1))
+    assert time.monotonic() - started < 0.5
+    assert not breaker.is_open  # Running out of our own budget is not the model failing
+
+
+def test_fallback_bank_serves_when_the_budget_runs_out():
+    bank = {(2, 1): [parse_question(reply())]}
+    question = pool(FakeModel("not json"), fallback=bank).take((2, 1))
+    assert question == bank[(2, 1)][0]
+
+
+def test_prefetches_are_not_capped_by_the_refill_workers():
+    model = FakeModel(reply(), latency=0.2)
+    questions = pool(model, workers=1, prefetch_workers=8)
+    started = time.monotonic()
+    futures = [questions.prefetch((2, 1), user=f"user{i}") for i in range(8)]
+    assert all(future.result(2).sop_id == "SOP-NAV-01" for future in futures)
+    assert time.monotonic() - started < 0.6  # All eight ran at once, not one at a time
+
+
+def test_keys_missing_from_a_cassette_are_not_refilled(tmp_path):
+    cassette = tmp_path / "cassette.jsonl"
+    cassette.write_text("")
+    model = ReplayModel(cassette)
+    calls = []
+    generate = model.generate_content
+    model.generate_content = lambda *args, **kwargs: calls.append(args) or generate(*args, **kwargs)
+    bank = {(2, 1): [parse_question(reply())]}
+    questions = QuestionPool(model, {(2, 1): "prompt"}, fallback=bank, workers=1)
+    deadline = time.monotonic() + 2
+    while (2, 1) not in questions._unrecorded:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    time.sleep(0.1)  # Let the rest of the first batch of refills finish
+    made = len(calls)
+    for _ in range(5):
+        assert questions.take((2, 1)) == bank[(2, 1)][0]
+    time.sleep(0.1)
+    assert len(calls) == made